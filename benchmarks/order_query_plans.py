@@ -0,0 +1,126 @@
+"""Fills a throwaway SQLite database with orders and prints the query plan
+and the time of every query made by OrderManager, the dashboard, the menu
+list, the JSON API and the tasks, to check that they use the indexes.
+
+    python benchmarks/order_query_plans.py [orders]
+
+It defaults to 1,000,000 orders, spread over 400 days.
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from uuid import uuid4
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.chdir(BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('SLACK_CLIENT_ID', 'benchmark')
+os.environ.setdefault('SLACK_CLIENT_SECRET', 'benchmark')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils.timezone import localdate, now
+
+DAYS = 400
+
+
+def fill(amount):
+    from menu.models import Menu
+    today = localdate(now())
+    per_day = max(amount // DAYS, 1)
+    Menu.objects.bulk_create([
+        Menu(date=today - timedelta(days=d), options=['a', 'b', 'c'],
+             sent=now(), to_be_deleted=(d % 50 == 0))
+        for d in range(DAYS)])
+    # SQLite doesn't return the ids of bulk inserts
+    menus = list(Menu.objects.order_by('-date'))
+    stamp = now().isoformat(' ')
+    rows = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for menu in menus:
+            for i in range(per_day):
+                selected = random.choice('abc') if i % 5 else None
+                fulfilled = stamp if selected and menu.date < today else None
+                rows.append((uuid4().hex, f'U{i:08}', 'Employee', 'D1',
+                             menu.id, menu.date.isoformat(), selected, stamp,
+                             stamp, stamp, fulfilled, '1.1'))
+            if len(rows) > 50000:
+                insert(cursor, rows)
+                rows = []
+        insert(cursor, rows)
+        cursor.execute('ANALYZE')
+    return menus
+
+
+def insert(cursor, rows):
+    cursor.executemany(
+        'INSERT INTO menu_order (id, employee_slack_id, employee_real_name, '
+        'employee_channel, menu_id, date, selected, created, modified, sent, '
+        'fulfilled, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def report(name, queryset, evaluate):
+    started = time.perf_counter()
+    evaluate(queryset)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f'{name} ({elapsed:.1f} ms)')
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        for row in cursor.fetchall():
+            print(f'    {row[-1]}')
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    path = Path(tempfile.mkdtemp()) / 'plans.sqlite3'
+    settings.DATABASES['default']['NAME'] = path
+    call_command('migrate', verbosity=0)
+
+    from menu.models import Menu, Order
+    from menu.pagination import after
+    started = time.perf_counter()
+    menus = fill(amount)
+    print(f'{Order.objects.count()} orders created in '
+          f'{time.perf_counter() - started:.1f}s at {path}\n')
+
+    day = menus[DAYS // 2].date
+    menu_id = menus[DAYS // 2].id
+    today = localdate(now())
+    ordering = ('date', 'created', 'id')
+    middle = Order.objects.sent().order_by(*ordering).values_list(
+        *ordering)[amount // 2]
+    queries = [
+        ('sent orders for a date', Order.objects.sent(date=day), list),
+        ('pending orders count', Order.objects.pending(date=day),
+         lambda q: q.count()),
+        ('active orders', Order.objects.active(date=today), list),
+        ('ready orders', Order.objects.ready(date=day), list),
+        ('dates with orders', Order.objects.sent().values_list(
+            'date', flat=True).distinct(), list),
+        ('unsent orders of a menu', Order.objects.filter(
+            menu_id=menu_id, sent__isnull=True), list),
+        ('sent unfulfilled orders of a menu', Order.objects.filter(
+            menu_id=menu_id, fulfilled__isnull=True, sent__isnull=False),
+         list),
+        ('API page in the middle of the orders', Order.objects.sent().filter(
+            after(ordering, middle)).order_by(*ordering)[:101], list),
+        ('listed menus', Menu.objects.filter(to_be_deleted=False), list),
+        ('menus for today', Menu.objects.filter(
+            date=today, to_be_deleted=False), list),
+    ]
+    for name, queryset, evaluate in queries:
+        report(name, queryset, evaluate)
+
+
+if __name__ == '__main__':
+    main()
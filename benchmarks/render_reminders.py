@@ -0,0 +1,73 @@
+"""Measures the cost of rendering one reminder message, with the Django
+template that was used before and with MenuMessage. It doesn't need a
+database or Slack credentials.
+
+    python benchmarks/render_reminders.py [orders]
+"""
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.chdir(BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('SLACK_CLIENT_ID', 'benchmark')
+os.environ.setdefault('SLACK_CLIENT_SECRET', 'benchmark')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.timezone import localdate, now
+
+from menu.messages import MenuMessage
+from menu.models import Menu, Order
+
+
+def build_orders(amount):
+    menu = Menu(date=localdate(now()),
+                options=['Seafood mix', 'Caesar salad', 'Beef and rice'])
+    orders = []
+    for i in range(amount):
+        orders.append(Order(
+            employee_slack_id=f'U{i:08}',
+            employee_real_name=f'Employee {i}',
+            menu=menu,
+            date=menu.date,
+            selected=menu.options[i % 4] if i % 4 < 3 else None,
+            notes='no onions' if i % 5 == 0 else None))
+    return menu, orders
+
+
+def render_with_template(menu, orders):
+    for order in orders:
+        template = get_template('order_message.txt')
+        template.render({
+            'order': order,
+            'today': order._today.date(),
+            'nora_url': settings.NORA_URL
+        })
+
+
+def render_with_menu_message(menu, orders):
+    message = MenuMessage(menu)
+    for order in orders:
+        message.render(order)
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    menu, orders = build_orders(amount)
+    for name, func in [('template', render_with_template),
+                       ('MenuMessage', render_with_menu_message)]:
+        best = min(timeit.repeat(lambda: func(menu, orders),
+                                 number=1, repeat=5))
+        print(f'{name:>12}: {best / amount * 1e6:8.2f} µs per message '
+              f'({amount} messages in {best:.3f}s)')
+
+
+if __name__ == '__main__':
+    main()
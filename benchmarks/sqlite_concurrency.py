@@ -0,0 +1,120 @@
+"""Runs a reminder worker and a web process writing to the same SQLite
+database at the same time, with the 'basic' and the 'production' database
+profiles, and prints how many writes each one made and how many failed
+because the database was locked.
+
+    python benchmarks/sqlite_concurrency.py [seconds] [orders]
+
+The worker marks the orders as sent in batches like send_reminder_chunk,
+while the web process saves selections like UpdateOrder and reads the
+order counts like the order list. It defaults to 10 seconds per profile
+and 20,000 orders.
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.chdir(BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('SLACK_CLIENT_ID', 'benchmark')
+os.environ.setdefault('SLACK_CLIENT_SECRET', 'benchmark')
+
+PROFILES = ['basic', 'production']
+
+
+def fill(amount):
+    from django.core.management import call_command
+    from django.utils.timezone import localdate, now
+    from menu.models import Menu, Order
+    call_command('migrate', verbosity=0)
+    menu = Menu.objects.create(date=localdate(now()), options=['a', 'b'])
+    Order.objects.bulk_create([
+        Order(employee_slack_id=f'U{i:08}', employee_real_name='Employee',
+              menu=menu, date=menu.date)
+        for i in range(amount)], batch_size=1000)
+
+
+def worker():
+    """Marks a batch of orders as sent"""
+    from django.utils.timezone import now
+    from menu.models import Order
+    orders = list(Order.objects.filter(sent__isnull=True)[:100])
+    if not orders:
+        Order.objects.update(sent=None)
+        return
+    for order in orders:
+        order.sent = now()
+        order.ts = '1.1'
+    Order.objects.bulk_update(orders, ['sent', 'ts'])
+
+
+def web():
+    """Saves a selection and reads the order counts"""
+    from django.db import transaction
+    from django.db.models import Count
+    from menu.models import Order, ACTIVE
+    with transaction.atomic():
+        order = Order.objects.order_by('?').first()
+        order.selected = random.choice('ab')
+        order.save()
+    Order.objects.aggregate(active=Count('pk', filter=ACTIVE))
+
+
+def run_role(role, seconds):
+    """Runs a role until the time is up and prints its result as JSON"""
+    from django.db import OperationalError
+    deadline = time.monotonic() + seconds
+    step = {'worker': worker, 'web': web}[role]
+    writes, locked = 0, 0
+    while time.monotonic() < deadline:
+        try:
+            step()
+            writes += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    print(json.dumps({'writes': writes, 'locked': locked}))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    amount = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    directory = Path(tempfile.mkdtemp())
+    for profile in PROFILES:
+        path = directory / f'{profile}.sqlite3'
+        env = {**os.environ, 'NORA_DB_PROFILE': profile,
+               'NORA_DB_NAME': str(path)}
+        subprocess.run([sys.executable, __file__, 'fill', str(amount)],
+                       env=env, check=True)
+        processes = {
+            role: subprocess.Popen(
+                [sys.executable, __file__, role, str(seconds)],
+                env=env, stdout=subprocess.PIPE, text=True)
+            for role in ('worker', 'web')}
+        print(f'{profile}:')
+        for role, process in processes.items():
+            out, _ = process.communicate()
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f'    {role}: {result["writes"] / seconds:.1f} writes/s, '
+                  f'{result["locked"]} locked errors')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] in ('fill', 'worker', 'web'):
+        # the parent sets the profile and the database in the environment
+        import django
+        django.setup()
+        if sys.argv[1] == 'fill':
+            fill(int(sys.argv[2]))
+        else:
+            run_role(sys.argv[1], float(sys.argv[2]))
+    else:
+        main()
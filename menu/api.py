@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.views.decorators.http import require_GET
+
+from menu.models import Menu, Order
+from menu.pagination import keyset_page
+from menu.views import requested_date
+from slack.auth import protected
+
+ORDER_FIELDS = ('id', 'employee_slack_id', 'employee_real_name', 'menu',
+                'date', 'selected', 'notes', 'created', 'modified', 'sent',
+                'fulfilled')
+ORDER_STATES = ('sent', 'pending', 'active', 'ready')
+MENU_FIELDS = ('id', 'date', 'options', 'sent')
+
+
+def paginated_response(request, queryset, ordering, allowed_fields):
+    """Returns a page of the queryset as JSON with the cursor of the next
+    one. The request can ask for some of the fields with ?fields=a,b and for
+    up to NORA_API_PAGE_SIZE rows with ?limit=n"""
+    fields = request.GET.get('fields')
+    fields = fields.split(',') if fields else allowed_fields
+    unknown = set(fields) - set(allowed_fields)
+    if unknown:
+        return HttpResponseBadRequest(
+            f'unknown fields: {", ".join(sorted(unknown))}')
+    try:
+        limit = int(request.GET.get('limit', settings.NORA_API_PAGE_SIZE))
+    except ValueError as _:
+        return HttpResponseBadRequest('limit must be a number')
+    limit = max(min(limit, settings.NORA_API_PAGE_SIZE), 1)
+    try:
+        rows, cursor = keyset_page(queryset, ordering,
+                                   request.GET.get('cursor'), limit, fields)
+    except (ValueError, ValidationError) as _:
+        return HttpResponseBadRequest('invalid cursor')
+    return JsonResponse({'results': rows, 'next': cursor})
+
+
+@require_GET
+@protected
+def order_list(request):
+    """The sent orders, they can be filtered by ?d=YYYYMMDD and by
+    ?state=pending|active|ready"""
+    state = request.GET.get('state', 'sent')
+    if state not in ORDER_STATES:
+        return HttpResponseBadRequest(
+            f'state must be one of {", ".join(ORDER_STATES)}')
+    orders = getattr(Order.objects, state)()
+    date = requested_date(request, None)
+    if date is not None:
+        orders = orders.filter(date=date)
+    return paginated_response(request, orders, ('date', 'created', 'id'),
+                              ORDER_FIELDS)
+
+
+@require_GET
+@protected
+def menu_list(request):
+    """The menus that weren't deleted, by date"""
+    menus = Menu.objects.filter(to_be_deleted=False)
+    return paginated_response(request, menus, ('date', 'id'), MENU_FIELDS)
@@ -0,0 +1,128 @@
+import os
+import gzip
+import json
+
+from pathlib import Path
+from datetime import date as Date
+from itertools import islice
+from typing import Iterator
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Q
+
+from menu.models import Menu, Order, OrderDate
+from menu.pagination import keyset_page
+
+# Every date is archived in its own file, with its menus first and then its
+# orders, one object per line in the format of Django's python serializer.
+# The files are written before anything is deleted, and the rows of a date
+# are deleted in a single transaction, so an interrupted run leaves the rows
+# in the database and the next run writes the file again. If the date was
+# archived before, the new file starts with the rows of the earlier one.
+
+
+def archive_path(date: Date) -> Path:
+    return Path(settings.NORA_ARCHIVE_DIR) / f'{date:%Y-%m-%d}.jsonl.gz'
+
+
+def _pages(queryset, ordering, size) -> Iterator[list]:
+    rows, cursor = keyset_page(queryset, ordering, None, size)
+    while rows:
+        yield rows
+        if cursor is None:
+            break
+        rows, cursor = keyset_page(queryset, ordering, cursor, size)
+
+
+def _write(lines, objects):
+    for obj in serializers.serialize('python', objects):
+        lines.write(json.dumps(obj, default=str) + '\n')
+
+
+def _merge(lines, path, size):
+    """Copies the lines of an earlier archive of the date, except the rows
+    that are in the database again, those are written with the others"""
+    if not path.exists():
+        return
+    with gzip.open(path, 'rt') as archived:
+        while batch := list(islice(archived, size)):
+            objects = [json.loads(line) for line in batch]
+            existing = set()
+            for label in {obj['model'] for obj in objects}:
+                pks = [obj['pk'] for obj in objects if obj['model'] == label]
+                existing |= {(label, str(pk)) for pk in apps.get_model(
+                    label).objects.filter(pk__in=pks).values_list(
+                        'pk', flat=True)}
+            for obj, line in zip(objects, batch):
+                if (obj['model'], str(obj['pk'])) not in existing:
+                    lines.write(line)
+
+
+def archive_date(date: Date) -> int:
+    """Moves the orders of a date to its archive file, with the menus that
+    were sent or deleted, and returns how many orders were archived"""
+    size = settings.NORA_ARCHIVE_CHUNK_SIZE
+    menus = Menu.objects.filter(date=date).filter(
+        Q(sent__isnull=False) | Q(to_be_deleted=True))
+    orders = Order.objects.filter(date=date)
+    path = archive_path(date)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.part')
+    count = 0
+    with gzip.open(partial, 'wt') as lines:
+        _merge(lines, path, size)
+        _write(lines, menus)
+        for page in _pages(orders, ('created', 'id'), size):
+            _write(lines, page)
+            count += len(page)
+    os.replace(partial, path)
+    with transaction.atomic():
+        while pks := list(orders.values_list('pk', flat=True)[:size]):
+            Order.objects.filter(pk__in=pks).delete()
+        menus.delete()
+        OrderDate.objects.filter(date=date).delete()
+    return count
+
+
+def restore_date(date: Date) -> int:
+    """Puts the orders and the menus of an archived date back in the
+    database, as they were archived, and removes its file. The rows that
+    are already there are kept. It returns how many orders were restored."""
+    path = archive_path(date)
+    size = settings.NORA_ARCHIVE_CHUNK_SIZE
+    batch, count = [], 0
+    with transaction.atomic():
+        with gzip.open(path, 'rt') as lines:
+            objects = serializers.deserialize(
+                'python', (json.loads(line) for line in lines))
+            for obj in objects:
+                # the menus are saved before the orders that point to them
+                if batch and (len(batch) >= size or
+                              type(batch[0]) is not type(obj.object)):
+                    count += _restore(batch)
+                batch.append(obj.object)
+            count += _restore(batch)
+        if Order.objects.sent(date=date).exists():
+            OrderDate.objects.record([date])
+    path.unlink()
+    return count
+
+
+def _restore(objects) -> int:
+    """Inserts the objects of a batch of the same model that aren't in the
+    database and empties it, it returns how many orders were inserted. They
+    are saved raw, like fixtures, so their creation and modification times
+    are the archived ones."""
+    if not objects:
+        return 0
+    model = type(objects[0])
+    existing = set(model.objects.filter(
+        pk__in=[obj.pk for obj in objects]).values_list('pk', flat=True))
+    new = [obj for obj in objects if obj.pk not in existing]
+    for obj in new:
+        obj.save_base(raw=True, force_insert=True)
+    objects.clear()
+    return len(new) if model is Order else 0
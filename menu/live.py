@@ -0,0 +1,142 @@
+import json
+import time
+import queue
+import logging
+import threading
+import functools
+
+from typing import Callable, Iterator, Optional
+from django.conf import settings
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+# seconds without events before the stream sends a comment, so proxies and
+# browsers don't close it
+HEARTBEAT = 15
+
+
+class Subscription:
+    """The events of a channel, it yields None every time the broker waited
+    too long without events. The subscription starts when it's created and
+    it has to be closed."""
+    def __init__(self, receive: Callable[[], Optional[str]],
+                 close: Callable[[], None]):
+        self.receive = receive
+        self.close = close
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        while True:
+            yield self.receive()
+
+
+class LocalBroker:
+    """Delivers the events to the subscribers of this process. Useful for
+    tests and single process deployments."""
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def publish(self, channel: str, data: str):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for events in subscribers:
+            events.put(data)
+
+    def subscribe(self, channel: str, timeout: float) -> Subscription:
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(events)
+
+        def receive():
+            try:
+                return events.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        def close():
+            with self.lock:
+                self.subscribers[channel].discard(events)
+        return Subscription(receive, close)
+
+
+class RedisBroker:
+    """Delivers the events through Redis pub/sub, so every web process
+    receives the events published by the others"""
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel: str, data: str):
+        import redis
+        try:
+            self.client.publish(channel, data)
+        except redis.RedisError as e:
+            # the board is refreshed on the next reload anyway
+            logger.warning(f'live event was not published: {e}')
+
+    def subscribe(self, channel: str, timeout: float) -> Subscription:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+
+        def receive():
+            message = pubsub.get_message(timeout=timeout)
+            return message['data'].decode() if message else None
+        return Subscription(receive, pubsub.close)
+
+
+@functools.lru_cache()
+def _build_broker(backend: str, url: str):
+    if backend == 'local':
+        return LocalBroker()
+    return RedisBroker(url)
+
+
+def get_broker():
+    """Returns the broker of the live order board for this process"""
+    return _build_broker(settings.NORA_LIVE_BACKEND,
+                         settings.CELERY_BROKER_URL)
+
+
+def _channel(date) -> str:
+    return f'nora:orders:{date:%Y%m%d}'
+
+
+def order_state(order) -> str:
+    if order.fulfilled is not None:
+        return 'ready'
+    return 'active' if order.selected is not None else 'pending'
+
+
+def publish_order(order, previous: str):
+    """Tells the boards of the order's date that it changed from the
+    previous state. The event has the rendered row so the boards don't have
+    to ask for it, and both states so they can count the pending orders
+    even when the order isn't on the page they show."""
+    state = order_state(order)
+    event = {
+        'id': str(order.pk),
+        'state': state,
+        'previous': previous,
+        'row': render_to_string('menu/order_row.html',
+                                {'order': order, 'state': state})
+    }
+    get_broker().publish(_channel(order.date), json.dumps(event))
+
+
+def order_events(date) -> Iterator[str]:
+    """The Server-Sent Events of the orders of a date. The stream ends after
+    NORA_LIVE_STREAM_SECONDS and the browser opens a new one."""
+    events = get_broker().subscribe(_channel(date), HEARTBEAT)
+    deadline = time.monotonic() + settings.NORA_LIVE_STREAM_SECONDS
+    try:
+        yield 'retry: 3000\n\n'
+        for data in events:
+            if data is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f'event: order\ndata: {data}\n\n'
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        events.close()
@@ -0,0 +1,60 @@
+from hashlib import sha1
+
+from django.conf import settings
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from django.utils.timezone import localtime, now
+
+
+def hash_message(text: str) -> str:
+    """Fingerprint of a message, to know if it changed since it was sent"""
+    return sha1(text.encode('utf-8')).hexdigest()
+
+
+class MenuMessage:
+    """Renders the reminder message of the orders of a menu. It produces the
+    same text as templates/order_message.txt, but the parts that are shared
+    by every order (the option list, the link) are built once per menu and
+    only the name, the selection and the order link are filled for each
+    order."""
+    def __init__(self, menu=None):
+        self.options = list(menu.options) if menu is not None else []
+        self.option_lines = [f'\nOption {i}: {option}\n'
+                             for i, option in enumerate(self.options, 1)]
+        self.order_url = conditional_escape(settings.NORA_URL) + '/menu/'
+        self.today = localtime(now()).date()
+        self.dates = {}
+
+    def format_date(self, date, today) -> str:
+        key = (date, date == today)
+        if key not in self.dates:
+            prefix = 'today, ' if date == today else ''
+            self.dates[key] = prefix + conditional_escape(localize(date))
+        return self.dates[key]
+
+    def render(self, order) -> str:
+        parts = [
+            'Hello, ', conditional_escape(order.employee_real_name), '!\n',
+            'This is the menu for ',
+            self.format_date(order.date, self.today), ' 😀\n\n'
+        ]
+        for i, option in enumerate(self.options):
+            if order.selected and option == order.selected:
+                notes = f'({order.notes})' if order.notes else ''
+                check = '✅✅' if order.fulfilled else '✅'
+                parts.append(
+                    f'\n*Option {i + 1}: {option}* {notes} {check}\n')
+            else:
+                parts.append(self.option_lines[i])
+        parts.append('\n\n')
+        if not order.fulfilled:
+            action = 'Change' if order.selected else 'Make'
+            parts.extend([
+                action, ' your selection by following <', self.order_url,
+                conditional_escape(order.id), '|this link>\n'
+            ])
+        else:
+            parts.append('Your order is being prepared and it will be '
+                         'delivered to you shortly!')
+        parts.append('\n\nHave a nice day! ☺')
+        return ''.join(parts)
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+def remove_duplicated_orders(apps, schema_editor):
+    """Keeps the oldest order of every (menu, employee) pair so the unique
+    constraint can be created"""
+    Order = apps.get_model('menu', 'Order')
+    seen = set()
+    duplicated = []
+    orders = Order.objects.filter(menu__isnull=False).order_by('created')
+    for order in orders.values('id', 'menu_id', 'employee_slack_id'):
+        key = (order['menu_id'], order['employee_slack_id'])
+        if key in seen:
+            duplicated.append(order['id'])
+        seen.add(key)
+    Order.objects.filter(id__in=duplicated).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_order_ordering'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_orders,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('menu', 'employee_slack_id'), name='unique_menu_employee'),
+        ),
+    ]
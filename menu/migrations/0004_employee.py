@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_order_unique_menu_employee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Employee',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slack_id', models.CharField(max_length=256, unique=True)),
+                ('real_name', models.CharField(max_length=256)),
+                ('tz', models.CharField(max_length=256, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['is_active', 'tz'], name='employee_recipients_idx'),
+        ),
+    ]
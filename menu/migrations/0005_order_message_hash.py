@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0004_employee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='message_hash',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
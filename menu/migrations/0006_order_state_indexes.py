@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0005_order_message_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(to_be_deleted=False), fields=['date'], name='menu_listed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(sent__isnull=False), fields=['date', 'created'], name='order_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('sent__isnull', False), ('fulfilled__isnull', True), ('selected__isnull', True)), fields=['date'], name='order_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('sent__isnull', False), ('fulfilled__isnull', True), ('selected__isnull', False)), fields=['date', 'created'], name='order_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('sent__isnull', False), ('fulfilled__isnull', False), ('selected__isnull', False)), fields=['date', 'created'], name='order_ready_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['menu', 'sent', 'fulfilled'], name='order_menu_state_idx'),
+        ),
+    ]
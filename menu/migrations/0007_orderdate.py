@@ -0,0 +1,31 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+def record_order_dates(apps, schema_editor):
+    """Fills the order dates with the dates of the orders already sent"""
+    Order = apps.get_model('menu', 'Order')
+    OrderDate = apps.get_model('menu', 'OrderDate')
+    dates = Order.objects.filter(sent__isnull=False).order_by().values_list(
+        'date', flat=True).distinct()
+    OrderDate.objects.bulk_create([OrderDate(date=date) for date in dates])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0006_order_state_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.RunPython(record_order_dates,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_orderdate'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_sent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(sent__isnull=False), fields=['date', 'created', 'id'], name='order_sent_idx'),
+        ),
+    ]
@@ -1,14 +1,49 @@
+from copy import deepcopy
 from uuid import uuid4
 from datetime import datetime, time
 
 from django.db import models
 from django.conf import settings
-from django.template.loader import get_template
 from django.utils import timezone
 
+from menu.messages import MenuMessage
+from menu.pages import expire_pages
 from menu.validators import validate_not_past, validate_list_of_strings
 
 
+class OrderDateManager(models.Manager):
+    def record(self, dates):
+        """Adds the dates that have sent orders, the known ones are skipped.
+        The pages are only expired when a date was added."""
+        dates = set(dates)
+        dates -= set(self.filter(date__in=dates).values_list('date', flat=True))
+        if dates:
+            self.bulk_create([OrderDate(date=date) for date in dates],
+                             ignore_conflicts=True)
+            expire_pages()
+
+    def forget(self, date):
+        """Removes the date if it doesn't have sent orders anymore"""
+        if not Order.objects.sent(date=date).exists():
+            self.filter(date=date).delete()
+            expire_pages()
+
+    def window(self, size):
+        """The latest size dates and whether there are older ones"""
+        dates = list(self.order_by('-date').values_list(
+            'date', flat=True)[:size + 1])
+        return dates[:size], len(dates) > size
+
+
+class OrderDate(models.Model):
+    """The dates that have sent orders. It's kept up to date when the orders
+    are sent so the order list doesn't need to scan every order to list
+    them."""
+    date = models.DateField(unique=True)
+
+    objects = OrderDateManager()
+
+
 class Menu(models.Model):
     """Represents a list of choices of meals for a defined date
     """
@@ -17,27 +52,114 @@ class Menu(models.Model):
     sent = models.DateTimeField(null=True, blank=True)
     to_be_deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # ListMenu and send_reminders only look at the listed menus
+            models.Index(fields=['date'], name='menu_listed_idx',
+                         condition=models.Q(to_be_deleted=False)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a copy, so changing the options in place is noticed
+        instance._loaded_values = deepcopy(dict(zip(field_names, values)))
+        return instance
+
+    def changed_fields(self):
+        """The fields that changed since the menu was loaded, every field
+        if it wasn't loaded from the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {f.attname for f in self._meta.concrete_fields}
+        return {name for name, value in loaded.items()
+                if getattr(self, name) != value}
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_values = {
+            f.attname: deepcopy(getattr(self, f.attname))
+            for f in self._meta.concrete_fields if f.attname in self.__dict__}
+
     def save(self, *args, **kwargs):
+        # a new menu doesn't have orders yet
+        changed = set() if self._state.adding else self.changed_fields()
+        if kwargs.get('update_fields') is not None:
+            changed &= set(kwargs['update_fields'])
         super(Menu, self).save(*args, **kwargs)
-        self.orders.update(date=self.date)
+        if 'date' in changed:
+            # only the orders that were moved are written
+            self.orders.exclude(date=self.date).update(date=self.date)
+            if self.sent is not None:
+                OrderDate.objects.record([self.date])
+                previous = getattr(self, '_loaded_values', {}).get('date')
+                if previous is not None:
+                    OrderDate.objects.forget(previous)
+        if changed & {'date', 'options'}:
+            # the orders show the options of their menu
+            expire_pages()
+        saved = kwargs.get('update_fields') or [
+            f.attname for f in self._meta.concrete_fields]
+        loaded = getattr(self, '_loaded_values', {})
+        for name in saved:
+            attname = self._meta.get_field(name).attname
+            loaded[attname] = deepcopy(getattr(self, attname))
+        self._loaded_values = loaded
+
+
+class EmployeeManager(models.Manager):
+    def recipients(self):
+        """Employees that should receive the menus"""
+        employees = self.filter(is_active=True)
+        if settings.NORA_ONLY_LOCALS:
+            employees = employees.filter(tz=settings.TIME_ZONE)
+        return employees
+
+
+class Employee(models.Model):
+    """Local directory of the Slack workspace members. It's refreshed
+    periodically by the sync_employees task so creating a menu doesn't need
+    to download the whole member list."""
+    slack_id = models.CharField(max_length=256, unique=True)
+    real_name = models.CharField(max_length=256)
+    tz = models.CharField(max_length=256, null=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'tz'],
+                         name='employee_recipients_idx'),
+        ]
+
+    objects = EmployeeManager()
+
+
+def threshold(date):
+    """The moment in which the orders of the date stop being received"""
+    cut_time = time(settings.NORA_THRESHOLD, 0)
+    return timezone.make_aware(datetime.combine(date, cut_time))
+
+
+# The states that a sent order can take
+SENT = models.Q(sent__isnull=False)
+PENDING = models.Q(fulfilled__isnull=True, selected__isnull=True)
+ACTIVE = models.Q(fulfilled__isnull=True, selected__isnull=False)
+READY = models.Q(fulfilled__isnull=False, selected__isnull=False)
 
 
 class OrderManager(models.Manager):
     """Defines the states that the order can take with filters"""
     def sent(self, **kwargs):
-        return self.filter(sent__isnull=False, **kwargs)
+        return self.filter(SENT, **kwargs)
 
     def pending(self, **kwargs):
-        return self.sent().filter(
-            fulfilled__isnull=True, selected__isnull=True, **kwargs)
+        return self.sent().filter(PENDING, **kwargs)
 
     def active(self, **kwargs):
-        return self.sent().filter(
-            fulfilled__isnull=True, selected__isnull=False, **kwargs)
+        return self.sent().filter(ACTIVE, **kwargs)
 
     def ready(self, **kwargs):
-        return self.sent().filter(
-            fulfilled__isnull=False, selected__isnull=False, **kwargs)
+        return self.sent().filter(READY, **kwargs)
 
 
 class Order(models.Model):
@@ -61,34 +183,76 @@ class Order(models.Model):
     sent = models.DateTimeField(null=True)
     fulfilled = models.DateTimeField(null=True)
     ts = models.CharField(max_length=256, null=True)
+    message_hash = models.CharField(max_length=40, null=True)
 
     class Meta:
         ordering = ['date', 'created']
+        constraints = [
+            models.UniqueConstraint(fields=['menu', 'employee_slack_id'],
+                                    name='unique_menu_employee'),
+        ]
+        # one partial index for each state in OrderManager, they follow the
+        # default ordering so the dashboard doesn't need to sort
+        indexes = [
+            # the id breaks the ties of the API pages
+            models.Index(fields=['date', 'created', 'id'],
+                         name='order_sent_idx', condition=SENT),
+            models.Index(fields=['date'], name='order_pending_idx',
+                         condition=SENT & PENDING),
+            models.Index(fields=['date', 'created'], name='order_active_idx',
+                         condition=SENT & ACTIVE),
+            models.Index(fields=['date', 'created'], name='order_ready_idx',
+                         condition=SENT & READY),
+            # the tasks look for the sent or unsent orders of a menu
+            models.Index(fields=['menu', 'sent', 'fulfilled'],
+                         name='order_menu_state_idx'),
+        ]
 
     objects = OrderManager()
-    _today = timezone.localtime(timezone.now())
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_sent = instance.__dict__.get('sent')
+        instance._loaded_menu_id = instance.__dict__.get('menu_id')
+        return instance
 
     def save(self, *args, **kwargs):
-        if self.menu:
+        update_fields = kwargs.get('update_fields')
+        # the date is copied from the menu only when the order gets a menu,
+        # Menu.save keeps it up to date afterwards
+        menu_changed = (self._state.adding or
+                        self.menu_id != getattr(self, '_loaded_menu_id', None))
+        if self.menu_id is not None and menu_changed:
             self.date = self.menu.date
+            if update_fields is not None and 'menu' in update_fields:
+                kwargs['update_fields'] = update_fields = [
+                    *update_fields, 'date']
         super(Order, self).save(*args, **kwargs)
+        if update_fields is None or 'menu' in update_fields:
+            self._loaded_menu_id = self.menu_id
+        if update_fields is None or 'sent' in update_fields:
+            if (self.sent is not None and
+                    getattr(self, '_loaded_sent', None) is None):
+                OrderDate.objects.record([self.date])
+            self._loaded_sent = self.sent
 
     @property
     def reminder_text(self):
-        template = get_template('order_message.txt')
-        return template.render({
-            'order': self,
-            'today': self._today.date(),
-            'nora_url': settings.NORA_URL
-        })
+        return MenuMessage(self.menu).render(self)
+
+    @property
+    def _today(self):
+        # read on every call, the processes outlive the day they started
+        return timezone.localtime(timezone.now())
 
     @property
     def valid_until(self):
-        cut_time = time(settings.NORA_THRESHOLD, 0)
-        return timezone.make_aware(datetime.combine(self.date, cut_time))
+        return threshold(self.date)
 
     @property
     def is_expired(self):
-        return (self.date < self._today.date() or
-                self._today >= self.valid_until or
+        today = self._today
+        return (self.date < today.date() or
+                today >= self.valid_until or
                 self.fulfilled is not None)
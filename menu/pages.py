@@ -0,0 +1,18 @@
+from time import time_ns
+
+from django.core.cache import cache
+
+PAGES_VERSION_KEY = 'menu:pages:version'
+
+
+def pages_version() -> int:
+    """Returns the version of the cached pages. It's part of their keys and
+    ETags, so changing it expires every page at once. If the cache loses it
+    a new one is made, so old pages are never served again."""
+    return cache.get_or_set(PAGES_VERSION_KEY, time_ns, None)
+
+
+def expire_pages():
+    """Expires the cached pages, it's called when something that isn't
+    tracked by the orders themselves changes, like a menu or the dates"""
+    cache.set(PAGES_VERSION_KEY, time_ns(), None)
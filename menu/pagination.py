@@ -0,0 +1,66 @@
+import json
+import base64
+
+from typing import List, Optional, Sequence, Tuple
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Encodes the ordering values of the last row of a page. Dates and
+    datetimes keep their microseconds, so no row is skipped or repeated."""
+    values = [v if isinstance(v, int) else
+              v.isoformat() if hasattr(v, 'isoformat') else str(v)
+              for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decodes a cursor made by encode_cursor, it raises ValueError if it
+    wasn't made for an ordering of size fields"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'invalid cursor: {e}')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('invalid cursor')
+    return values
+
+
+def after(ordering: Sequence[str], values: Sequence) -> Q:
+    """The rows that follow values in the ordering, like the row comparison
+    (a, b, c) > (x, y, z). The first field is also bounded on its own so the
+    database can seek the index instead of scanning it."""
+    fields = [f.lstrip('-') for f in ordering]
+    lookups = ['lt' if f.startswith('-') else 'gt' for f in ordering]
+    condition = Q()
+    for i, (field, lookup) in enumerate(zip(fields, lookups)):
+        equal = {f: v for f, v in zip(fields[:i], values[:i])}
+        condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+    first = {f'{fields[0]}__{lookups[0]}e': values[0]}
+    return Q(**first) & condition
+
+
+def keyset_page(queryset: QuerySet, ordering: Sequence[str],
+                cursor: Optional[str], size: int,
+                fields: Sequence[str]=()) -> Tuple[List, Optional[str]]:
+    """Returns a page of the queryset that starts after the cursor, and the
+    cursor of the next page or None if it's the last one. The ordering must
+    be unique, so it usually ends with the primary key. If fields are given
+    the rows are dicts with just those fields."""
+    keys = [f.lstrip('-') for f in ordering]
+    if cursor:
+        queryset = queryset.filter(
+            after(ordering, decode_cursor(cursor, len(ordering))))
+    queryset = queryset.order_by(*ordering)
+    if fields:
+        queryset = queryset.values(*dict.fromkeys([*fields, *keys]))
+    rows = list(queryset[:size + 1])
+    cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        cursor = encode_cursor([last[k] if fields else getattr(last, k)
+                                for k in keys])
+    if fields:
+        rows = [{f: row[f] for f in fields} for row in rows]
+    return rows, cursor
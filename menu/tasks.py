@@ -1,97 +1,297 @@
+from datetime import date as Date, timedelta
+from http.client import HTTPException
+from itertools import islice
+
 from django.conf import settings
+from django.db import OperationalError
+from django.db.models import Q
 from django.utils.timezone import localtime, now
-from celery import shared_task
+from celery import shared_task, chord
 from celery.utils.log import get_task_logger
+from slack_sdk.errors import SlackApiError
 
-from menu.models import Menu, Order
-from slack.api import (get_users, create_reminder,
+from menu.archive import archive_date, restore_date
+from menu.messages import MenuMessage, hash_message
+from menu.models import Menu, Order, OrderDate, Employee
+from menu.pages import expire_pages
+from slack.api import (get_member_pages, create_reminder,
                        send_private_message, delete_message)
+from slack.dispatch import dispatch, Throughput
+from slack.ratelimit import RateLimitExceeded
 
 logger = get_task_logger(__name__)
 
+
+def chunks(iterable, size):
+    """Splits the iterable in lists of up to size elements"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def retry_later(task, exc, progress=False):
+    """Defers a rate-limited task with a bounded exponential backoff, but
+    never sooner than the rate limit asked for. The worker is free to run
+    other tasks in the meantime.
+    If the attempt made progress the task is replaced by a new run that
+    continues the remaining work as soon as the rate limit allows, with a
+    fresh retry count, so long tasks aren't given up while they move
+    forward. The new run keeps the task id, so chords still wait for it."""
+    if progress and not task.request.called_directly:
+        logger.info(f'{task.name} was rate-limited after making progress, '
+                    f'continuing in {exc.retry_after}s')
+        return task.replace(task.signature(
+            task.request.args, task.request.kwargs,
+            countdown=exc.retry_after))
+    countdown = settings.SLACK_RETRY_BACKOFF * 2 ** task.request.retries
+    countdown = min(max(countdown, exc.retry_after),
+                    settings.SLACK_RETRY_BACKOFF_MAX)
+    logger.info(f'{task.name} was rate-limited, retrying in {countdown}s')
+    return task.retry(exc=exc, countdown=countdown,
+                      max_retries=settings.SLACK_MAX_RETRIES)
+
 # Menu triggered tasks
 
 @shared_task
 def create_orders(menu_id):
+    """Creates an order for every employee that doesn't have one for this
+    menu yet. The orders are inserted in bulk and the unique constraint on
+    (menu, employee) makes retried or concurrent runs skip the existing ones
+    instead of duplicating them."""
     menu = Menu.objects.get(pk=menu_id)
-    users = get_users()
-    for user_id, user_name in users:
-        Order.objects.get_or_create(
-            employee_slack_id=user_id,
-            employee_real_name=user_name,
-            menu=menu)
+    employees = Employee.objects.recipients()
+    users = list(employees.values_list('slack_id', 'real_name'))
+    if not users and not Employee.objects.exists():
+        # the directory was never synced, this happens only once
+        sync_employees()
+        users = list(employees.values_list('slack_id', 'real_name'))
+    existing = menu.orders.count()
+    Order.objects.bulk_create([
+        Order(employee_slack_id=user_id,
+              employee_real_name=user_name,
+              menu=menu,
+              date=menu.date)
+        for user_id, user_name in users
+    ], ignore_conflicts=True)
+    created = menu.orders.count() - existing
+    skipped = len(users) - created
+    logger.info(f'Created {created} orders for menu {menu.id}, '
+                f'skipped {skipped}')
     if settings.NORA_NOTIFY_HOUR == -1:
-        send_reminders(menu_id=menu_id)
+        send_reminders.delay(menu_id=menu_id)
+    return {'created': created, 'skipped': skipped}
 
 
-@shared_task
-def notify_menu_change(menu_id):
+@shared_task(bind=True)
+def notify_menu_change(self, menu_id):
     """If a menu is updated and has already sent reminders to the users,
     this task will do two things:
-    - it will update the message for all the users that haven't made a
-      selection yet.
-    - if the user already has selected an option it will send a message
-      to the user saying that the menu has changed. It will also tell the
-      users if their option was removed."""
-    orders = Order.objects.filter(
-        menu_id=menu_id, 
-        fulfilled__isnull=True, 
-        sent__isnull=False)
+    - it will update the message of the users whose message changed, the
+      orders store a hash of the last message so the rest are skipped.
+    - if the option selected by the user was removed it will send a message
+      to the user saying that the menu has changed.
+    The messages are updated concurrently and saved in batches, so a retry
+    after a rate limit skips the messages that were already updated."""
+    menu = Menu.objects.get(pk=menu_id)
+    message = MenuMessage(menu)
+    orders = menu.orders.filter(fulfilled__isnull=True, sent__isnull=False)
+    jobs = _changed_messages(orders, message)
+    throughput = Throughput()
+    try:
+        for batch in chunks(jobs, settings.NORA_REMINDER_BATCH_SIZE):
+            updated = []
+            try:
+                for (order, text), (channel, ts) in dispatch(
+                        _notify_change, batch, throughput=throughput):
+                    order.employee_channel = channel
+                    order.ts = ts
+                    order.message_hash = hash_message(text)
+                    updated.append(order)
+            finally:
+                Order.objects.bulk_update(
+                    updated, ['employee_channel', 'ts', 'message_hash'])
+    except RateLimitExceeded as e:
+        return retry_later(self, e, progress=throughput.count > 0)
+    return throughput.as_dict()
+
+
+def _changed_messages(orders, message):
+    """Yields the orders whose message is different from the one sent"""
     for order in orders:
-        update_order(order.pk)
-        if order.selected is not None:
-            text = ('Sorry to bother you again but today\'s menu has changed '
-                    'and you may want to check it out 👀 maybe you like it better.')
-            if order.selected not in order.menu.options:
-                text += ' *Your previous choice is no longer available or it changed.*'
-            send_private_message(order.employee_slack_id, text)
+        text = message.render(order)
+        if hash_message(text) != order.message_hash:
+            yield order, text
 
 
-@shared_task
-def notify_menu_deleted(menu_id):
+def _notify_change(job):
+    """Updates the message of an order, and tells the user if the option
+    they had selected was removed"""
+    order, text = job
+    channel, ts = send_private_message(order.employee_channel, text, order.ts)
+    if order.selected is not None and order.selected not in order.menu.options:
+        send_private_message(
+            order.employee_slack_id,
+            'Sorry to bother you again but today\'s menu has changed and you '
+            'may want to check it out 👀 maybe you like it better. *Your '
+            'previous choice is no longer available or it changed.*')
+    return channel, ts
+
+
+@shared_task(bind=True)
+def notify_menu_deleted(self, menu_id):
     """If a menu is deleted and has already sent reminders to users,
     this task will do two things:
     - it will delete the message for all users.
     - it will send a new message to users who had made a selection, telling
       them to wait for a new menu.
     Q: why not just editing the order message?
-    A: We want them to get notified that they're not receiving their lunch."""
+    A: We want them to get notified that they're not receiving their lunch.
+    The Slack calls are made concurrently. Each batch of cleaned orders is
+    marked by clearing its sent date, so a retry starts where it stopped,
+    and the orders are deleted all at once at the end, expiring the cached
+    order pages."""
     menu = Menu.objects.get(pk=menu_id)
-    orders = Order.objects.filter(
-        menu=menu, fulfilled__isnull=True, sent__isnull=False)
-    for order in orders:
-        delete_message(order.employee_channel, order.ts)
-        if order.selected:
-            text = ('There was a mistake with the previous menu, but I\'ll '
-                    'contact you shorty with a new one. Sorry!! 😅')
-            send_private_message(order.employee_slack_id, text)
-        order.delete()
+    orders = menu.orders.filter(fulfilled__isnull=True, sent__isnull=False)
+    throughput = Throughput()
+    try:
+        for batch in chunks(orders, settings.NORA_REMINDER_BATCH_SIZE):
+            cleaned = []
+            try:
+                for order, _ in dispatch(_clean_deleted_order, batch,
+                                         throughput=throughput):
+                    order.sent = None
+                    cleaned.append(order)
+            finally:
+                Order.objects.bulk_update(cleaned, ['sent'])
+    except RateLimitExceeded as e:
+        return retry_later(self, e, progress=throughput.count > 0)
+    # the cleaned orders and the ones that were never sent
+    menu.orders.filter(fulfilled__isnull=True, sent__isnull=True).delete()
     menu.delete()
+    OrderDate.objects.forget(menu.date)
+    expire_pages()
+
+
+def _clean_deleted_order(order):
+    delete_message(order.employee_channel, order.ts)
+    if order.selected:
+        text = ('There was a mistake with the previous menu, but I\'ll '
+                'contact you shorty with a new one. Sorry!! 😅')
+        send_private_message(order.employee_slack_id, text)
 
 
 # Order triggered tasks
 
-@shared_task
-def update_order(order_id):
+@shared_task(bind=True)
+def update_order(self, order_id):
     """This will update the message sent to an user. It's called when the user
     makes a selection or when the menu is changed.
     """
-    order = Order.objects.get(pk=order_id)
-    channel, ts = send_private_message(
-        order.employee_channel, 
-        order.reminder_text, 
-        order.ts)
+    order = Order.objects.select_related('menu').get(pk=order_id)
+    text = MenuMessage(order.menu).render(order)
+    if hash_message(text) == order.message_hash:
+        # the message didn't change
+        return
+    try:
+        channel, ts = send_private_message(
+            order.employee_channel,
+            text,
+            order.ts)
+    except RateLimitExceeded as e:
+        return retry_later(self, e)
     order.employee_channel = channel
     order.ts = ts
-    order.save()
+    order.message_hash = hash_message(text)
+    order.save(update_fields=['employee_channel', 'ts', 'message_hash'])
 
 # Periodic tasks
 
+@shared_task(bind=True)
+def sync_employees(self):
+    """Refreshes the employee directory with the Slack member list. Only the
+    employees that changed are written: new hires are added, deleted users
+    are deactivated and names and time zones are updated."""
+    known = {e.slack_id: e for e in Employee.objects.all()}
+    seen = set()
+    created, updated = [], []
+    try:
+        for members in get_member_pages():
+            for member in members:
+                seen.add(member['id'])
+                values = {
+                    'real_name': member['real_name'] or '',
+                    'tz': member['tz'],
+                    'is_active': not member['deleted']
+                }
+                employee = known.get(member['id'])
+                if employee is None:
+                    created.append(
+                        Employee(slack_id=member['id'], **values))
+                elif any(getattr(employee, f) != v for f, v in values.items()):
+                    for field, value in values.items():
+                        setattr(employee, field, value)
+                    updated.append(employee)
+    except SlackApiError as e:
+        logger.error(f'sync_employees: {e.response["error"]}')
+        return None
+    except RateLimitExceeded as e:
+        return retry_later(self, e)
+    # users that aren't listed anymore are deactivated too
+    for slack_id in set(known) - seen:
+        employee = known[slack_id]
+        if employee.is_active:
+            employee.is_active = False
+            updated.append(employee)
+    Employee.objects.bulk_create(created, ignore_conflicts=True)
+    Employee.objects.bulk_update(
+        updated, ['real_name', 'tz', 'is_active'], batch_size=500)
+    logger.info(f'Synced employees: {len(created)} added, '
+                f'{len(updated)} updated')
+    return {'created': len(created), 'updated': len(updated)}
+
+
+@shared_task
+def archive_orders():
+    """Moves the orders older than NORA_ARCHIVE_DAYS, and their sent or
+    deleted menus, to the archive files. Each date is archived on its own,
+    so an interrupted run only has to repeat the date it was working on."""
+    if settings.NORA_ARCHIVE_DAYS == 0:
+        return {}
+    before = localtime(now()).date() - timedelta(
+        days=settings.NORA_ARCHIVE_DAYS)
+    dates = set(Order.objects.filter(date__lt=before).order_by().values_list(
+        'date', flat=True).distinct())
+    dates |= set(Menu.objects.filter(
+        Q(sent__isnull=False) | Q(to_be_deleted=True),
+        date__lt=before).values_list('date', flat=True))
+    archived = {}
+    for date in sorted(dates):
+        archived[date.isoformat()] = archive_date(date)
+    if archived:
+        expire_pages()
+    logger.info(f'Archived {sum(archived.values())} orders of '
+                f'{len(archived)} days')
+    return archived
+
+
+@shared_task
+def restore_orders(date):
+    """Puts back the orders of an archived date, given as YYYY-MM-DD"""
+    count = restore_date(Date.fromisoformat(date))
+    expire_pages()
+    logger.info(f'Restored {count} orders of {date}')
+    return count
+
+
 @shared_task
 def send_reminders(menu_id=None):
     """Sends the messages to the users related to this menu.
     This task is scheduled to occur at the day of the menu, at the hour set by
     NOTIFY_HOUR in the settings.
+    The unsent orders of each menu are split in chunks of
+    NORA_REMINDER_CHUNK_SIZE that are sent by send_reminder_chunk tasks, so
+    every worker takes part in it. The menu is marked as sent only after
+    every chunk has finished.
     If the SLACK_USE_REMINDERS option is set, it will use reminders instead of
     sending direct messages, but reminders can't be updated, so much of the
     usability of the app will be lost."""
@@ -100,19 +300,88 @@ def send_reminders(menu_id=None):
     else:
         local_now = localtime(now())
         menus = Menu.objects.filter(date=local_now.date())
+    menus = menus.filter(to_be_deleted=False)
+    dispatched = {}
     for menu in menus:
         orders = menu.orders.filter(sent__isnull=True)
-        logger.info(f'Sending {len(orders)} reminders for menu {menu.id}...')
-        for order in orders:
-            text = order.reminder_text
-            if settings.SLACK_USE_REMINDERS:
-                create_reminder(order.employee_slack_id, text)
-            else:
-                channel, ts = send_private_message(
-                    order.employee_slack_id, text)
-                order.employee_channel = channel
-                order.ts = ts
+        order_ids = [str(pk) for pk in orders.values_list('pk', flat=True)]
+        header = [send_reminder_chunk.s(menu.id, chunk) for chunk in
+                  chunks(order_ids, settings.NORA_REMINDER_CHUNK_SIZE)]
+        logger.info(f'Sending {len(order_ids)} reminders for menu {menu.id} '
+                    f'in {len(header)} chunks...')
+        if header:
+            chord(header)(finish_reminders.s(menu.id))
+        else:
+            finish_reminders([], menu.id)
+        dispatched[menu.id] = len(header)
+    return dispatched
+
+
+# errors that don't outlast a retry: dropped or timed out connections to
+# Slack and a database locked by the other process
+TRANSIENT_ERRORS = (OSError, HTTPException, OperationalError)
+
+
+@shared_task(bind=True, autoretry_for=TRANSIENT_ERRORS,
+             retry_backoff=settings.SLACK_RETRY_BACKOFF,
+             retry_backoff_max=settings.SLACK_RETRY_BACKOFF_MAX,
+             max_retries=settings.SLACK_MAX_RETRIES)
+def send_reminder_chunk(self, menu_id, order_ids):
+    """Sends the reminders of a chunk of orders of a menu. If Slack's rate
+    limit is reached, or the connection or the database fail, only this
+    chunk is retried later, and the retry only sends the orders that weren't
+    sent yet. It returns the throughput of the chunk."""
+    menu = Menu.objects.get(pk=menu_id)
+    throughput = Throughput()
+    if menu.to_be_deleted:
+        return throughput.as_dict()
+    orders = menu.orders.filter(pk__in=order_ids, sent__isnull=True)
+    message = MenuMessage(menu)
+    try:
+        for batch in chunks(orders, settings.NORA_REMINDER_BATCH_SIZE):
+            _send_reminder_chunk(batch, message, throughput)
+    except RateLimitExceeded as e:
+        # the orders that were sent are saved, the retry sends the rest
+        return retry_later(self, e, progress=throughput.count > 0)
+    return throughput.as_dict()
+
+
+@shared_task
+def finish_reminders(results, menu_id):
+    """Called once every chunk of the menu was sent"""
+    Menu.objects.filter(pk=menu_id).update(sent=now())
+    count = sum(r['count'] for r in results)
+    seconds = max([r['seconds'] for r in results], default=0)
+    logger.info(f'Sent {count} reminders for menu {menu_id}, the slowest '
+                f'of {len(results)} chunks took {seconds}s')
+    return {'count': count, 'chunks': len(results), 'seconds': seconds}
+
+
+def _send_reminder_chunk(orders, message, throughput):
+    """Sends the reminders of a chunk of orders and saves the ones that were
+    sent with a single bulk update, even if the chunk is interrupted, so
+    they are never sent again. Their dates are added to the order dates."""
+    sent = []
+    jobs = ((order, message.render(order)) for order in orders)
+    try:
+        for (order, text), (channel, ts) in dispatch(
+                _send_reminder, jobs, throughput=throughput):
+            order.employee_channel = channel
+            order.ts = ts
+            order.message_hash = hash_message(text)
             order.sent = now()
-            order.save()
-        menu.sent = now()
-        menu.save()
+            sent.append(order)
+    finally:
+        Order.objects.bulk_update(
+            sent, ['employee_channel', 'ts', 'message_hash', 'sent'])
+        OrderDate.objects.record(order.date for order in sent)
+
+
+def _send_reminder(job):
+    """Sends a single reminder, it runs in the dispatch threads so it only
+    talks to Slack and leaves the bookkeeping to the caller"""
+    order, text = job
+    if settings.SLACK_USE_REMINDERS:
+        create_reminder(order.employee_slack_id, text)
+        return (order.employee_channel, order.ts)
+    return send_private_message(order.employee_slack_id, text)
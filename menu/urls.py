@@ -1,18 +1,22 @@
 from django.urls import path
 
+from menu import api
 from menu.views import (
     CreateMenu, ListMenu,
     UpdateMenu, UpdateOrder, DeleteMenu, ListOrder,
-    order_completed
+    order_completed, order_stream
 )
 
 app_name = 'menu'
 urlpatterns = [
     path('order/delete/<int:pk>', DeleteMenu.as_view(), name='menu-delete'),
     path('order/complete/<str:pk>', order_completed, name='order-complete'),
+    path('order/stream/', order_stream, name='order-stream'),
     path('menu/new/', CreateMenu.as_view(), name='menu-create'),
     path('menu/list/', ListMenu.as_view(), name='menu-list'),
     path('menu/edit/<int:pk>', UpdateMenu.as_view(), name='menu-update'),
     path('menu/<str:pk>', UpdateOrder.as_view(), name='order-update'),
+    path('api/orders/', api.order_list, name='api-order-list'),
+    path('api/menus/', api.menu_list, name='api-menu-list'),
     path('', ListOrder.as_view(), name='order-list')
 ]
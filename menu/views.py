@@ -1,6 +1,9 @@
+from hashlib import sha1
 from datetime import datetime
 
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
 from django.urls import reverse
 from django.shortcuts import render
 from django.http import HttpResponseBadRequest
@@ -9,8 +12,17 @@ from django.utils.decorators import method_decorator
 from django.contrib.messages.views import SuccessMessageMixin
 from django.views.generic import CreateView, UpdateView, ListView, DeleteView
 from django.shortcuts import get_object_or_404
-
-from menu.models import Order, Menu
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from menu.models import (Order, OrderDate, Menu, PENDING, ACTIVE, READY,
+                         threshold)
+from menu.pages import pages_version
+from menu.pagination import keyset_page
+from menu.live import order_events, order_state, publish_order
 from menu.forms import OrderForm, MenuForm
 from menu.tasks import (create_orders, update_order, notify_menu_change, 
                         notify_menu_deleted)
@@ -18,18 +30,107 @@ from menu.tasks import (create_orders, update_order, notify_menu_change,
 from slack.auth import protected
 
 
+def requested_date(request, default, name='d'):
+    """The date in the name parameter of the request, as YYYYMMDD or as
+    YYYY-MM-DD like the date inputs send it"""
+    d_value = request.GET.get(name, '')
+    for date_format in ('%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(d_value, date_format).date()
+        except ValueError as _:
+            pass
+    return default
+
+
+def with_params(request, **params):
+    """The query string of the request with some parameters replaced, the
+    ones set to None are removed"""
+    query = request.GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return f'?{query.urlencode()}'
+
+
+def page(request, queryset, ordering, name):
+    """A page of NORA_PAGE_SIZE rows that starts at the cursor in the name
+    parameter of the request. A broken cursor shows the first page."""
+    cursor = request.GET.get(name)
+    try:
+        return keyset_page(queryset, ordering, cursor, settings.NORA_PAGE_SIZE)
+    except (ValueError, ValidationError) as _:
+        return keyset_page(queryset, ordering, None, settings.NORA_PAGE_SIZE)
+
+
 @method_decorator(protected(redirect_to='/slack/login/'), name='dispatch')
 class ListOrder(ListView):
+    """The orders of a day. The page has an ETag and Last-Modified so
+    browsers can revalidate it, and once the day is closed, when it's past
+    the threshold and every order was fulfilled, the rendered page is kept in
+    the cache because it won't change anymore."""
     model = Order
-    local_now = localtime(now())
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.local_now = localtime(now())
+
+    def get(self, request, *args, **kwargs):
+        date = self.get_date()
+        version = pages_version()
+        # the page depends on the date it shows and on the parameters of the
+        # picker and the tables, not on how the query string was written
+        params = (f'{date:%Y%m%d}', self.get_days(), self.get_state(),
+                  request.GET.get('active_cursor'),
+                  request.GET.get('ready_cursor'))
+        page_id = sha1(repr(params).encode()).hexdigest()
+        key = f'menu:order-list:{page_id}:{version}'
+        page = cache.get(key)
+        if page is None:
+            # one pass counts every state for the page, and any change of
+            # the orders of the day changes their count or when the last one
+            # was modified
+            self.stats = self.get_queryset().aggregate(
+                modified=Max('modified'),
+                count=Count('pk'),
+                pending=Count('pk', filter=PENDING),
+                active=Count('pk', filter=ACTIVE),
+                ready=Count('pk', filter=READY))
+            modified = self.stats['modified'] or self.local_now
+            etag = quote_etag(f'{version}-{page_id}-{self.stats["count"]}-'
+                              f'{modified.timestamp()}')
+            closed = (self.stats['active'] == 0 and
+                      self.local_now >= threshold(date))
+        else:
+            etag, modified, content = page
+        last_modified = int(modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None and page is None:
+            response = super().get(request, *args, **kwargs)
+            response.render()
+            if closed:
+                cache.set(key, (etag, modified, response.content),
+                          settings.NORA_PAGE_CACHE_SECONDS)
+        elif response is None:
+            response = HttpResponse(content)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
 
     def get_date(self):
+        return requested_date(self.request, self.local_now.date())
+
+    def get_days(self):
         try:
-            d_value = self.request.GET.get('d', '')
-            return datetime.strptime(d_value, '%Y%m%d').date()
+            return max(int(self.request.GET.get('days', '')), 1)
         except ValueError as _:
-            pass
-        return self.local_now.date()
+            return settings.NORA_DATE_PICKER_DAYS
+
+    def get_state(self):
+        """The table that is shown alone, if any"""
+        state = self.request.GET.get('state')
+        return state if state in ('active', 'ready') else None
 
     def get_queryset(self, *args, **kwargs):
         return self.model.objects.sent(date=self.get_date())
@@ -38,18 +139,56 @@ class ListOrder(ListView):
         context = super().get_context_data(**kwargs)
         date = self.get_date()
         context['selected_date'] = date
-        dates = self.model.objects.sent().values_list(
-            'date', flat=True).distinct()
+        # the picker shows the latest days with orders, older days are
+        # listed by asking for a bigger window
+        days = self.get_days()
+        dates, has_older = OrderDate.objects.window(days)
         dates = set(dates)
         dates.add(self.local_now.date())
+        dates.add(date)
         context['dates'] = sorted(dates)
-        context['active_orders'] = self.model.objects.active(date=date)
-        context['pending_orders'] = self.model.objects.pending(
-            date=date).count()
-        context['ready_orders'] = self.model.objects.ready(date=date)
+        context['days'] = days
+        context['older_days'] = days * 2 if has_older else None
+        # the states were counted by get, the tables bring one page of their
+        # orders each, with their menus
+        context['pending_orders'] = self.stats['pending']
+        context['state'] = self.get_state()
+        for state, condition in (('active', ACTIVE), ('ready', READY)):
+            context[f'{state}_orders'] = []
+            context[f'{state}_next'] = None
+            context[f'{state}_paginated'] = False
+            if context['state'] not in (None, state):
+                continue
+            orders = self.object_list.filter(condition).select_related('menu')
+            rows, cursor = page(self.request, orders,
+                                ('date', 'created', 'id'), f'{state}_cursor')
+            context[f'{state}_orders'] = rows
+            # the board only adds rows to a table that shows all its orders
+            context[f'{state}_paginated'] = bool(
+                cursor or self.request.GET.get(f'{state}_cursor'))
+            if cursor:
+                context[f'{state}_next'] = with_params(
+                    self.request, **{f'{state}_cursor': cursor})
+        if {'active_cursor', 'ready_cursor'} & set(self.request.GET):
+            context['first_page'] = with_params(
+                self.request, active_cursor=None, ready_cursor=None)
         return context
 
 
+# live order list
+@protected
+def order_stream(request):
+    """Streams the changes of the orders of a date as Server-Sent Events, the
+    order list uses them to patch its tables without reloading"""
+    date = requested_date(request, localtime(now()).date())
+    response = StreamingHttpResponse(order_events(date),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # tells nginx to send the events as soon as they arrive
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # create menu
 @method_decorator(protected, name='dispatch')
 class CreateMenu(CreateView):
@@ -95,8 +234,32 @@ class UpdateMenu(SuccessMessageMixin, UpdateView):
 # list menus
 @method_decorator(protected, name='dispatch')
 class ListMenu(ListView):
+    """The menus from the latest, a page at a time. They can be filtered by
+    date with ?from=YYYYMMDD and ?to=YYYYMMDD"""
     queryset = Menu.objects.filter(to_be_deleted=False)
 
+    def get_queryset(self):
+        menus = super().get_queryset()
+        since = requested_date(self.request, None, 'from')
+        if since is not None:
+            menus = menus.filter(date__gte=since)
+        until = requested_date(self.request, None, 'to')
+        if until is not None:
+            menus = menus.filter(date__lte=until)
+        return menus
+
+    def get_context_data(self, **kwargs):
+        menus, cursor = page(self.request, self.object_list,
+                             ('-date', '-id'), 'cursor')
+        context = super().get_context_data(object_list=menus, **kwargs)
+        context['since'] = requested_date(self.request, None, 'from')
+        context['until'] = requested_date(self.request, None, 'to')
+        context['next_page'] = (with_params(self.request, cursor=cursor)
+                                if cursor else None)
+        if 'cursor' in self.request.GET:
+            context['first_page'] = with_params(self.request, cursor=None)
+        return context
+
 
 # delete menu
 @method_decorator(protected, name='dispatch')
@@ -112,7 +275,7 @@ class DeleteMenu(DeleteView):
     def delete(self, request, *args, **kwargs):
         menu = self.get_object()
         menu.to_be_deleted = True
-        menu.save()
+        menu.save(update_fields=['to_be_deleted'])
         notify_menu_deleted.delay(menu.pk)
         return HttpResponseRedirect(reverse('menu:menu-list'))
 
@@ -123,9 +286,16 @@ class UpdateOrder(SuccessMessageMixin, UpdateView):
     form_class = OrderForm
     success_message = 'Order saved successfully!'
 
+    def get_object(self, *args, **kwargs):
+        order = super(UpdateOrder, self).get_object(*args, **kwargs)
+        # the form changes the order before it's saved
+        self.previous_state = order_state(order)
+        return order
+
     def form_valid(self, *args, **kwargs):
         response = super(UpdateOrder, self).form_valid(*args, **kwargs)
         update_order.delay(self.object.pk)
+        publish_order(self.object, self.previous_state)
         return response
 
     def form_invalid(self, *args, **kwargs):
@@ -146,9 +316,11 @@ def order_completed(request, pk):
             'you can\'t complete an order with no selection')
     if order.fulfilled:
         return HttpResponseBadRequest('you can\'t unfinalize an order')
+    previous = order_state(order)
     order.fulfilled = now()
-    order.save()
+    order.save(update_fields=['fulfilled', 'modified'])
     update_order.delay(order.pk)
+    publish_order(order, previous)
     d_value = order.date.strftime('%Y%m%d')
     return HttpResponseRedirect(reverse('menu:order-list')+f'?d={d_value}')
 
@@ -71,10 +71,49 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+NORA_DB_PROFILE = environ.get('NORA_DB_PROFILE', 'production') #'production' tunes SQLite for the web process and the worker writing at the same time, 'basic' uses its defaults
+NORA_DB_TIMEOUT = max(int(environ.get('NORA_DB_TIMEOUT', 20)), 0) #seconds that a write waits for the database lock before failing
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'project.sqlite3',
+        'NAME': environ.get('NORA_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'timeout': NORA_DB_TIMEOUT,
+        },
+    }
+}
+
+if NORA_DB_PROFILE == 'production':
+    # the readers don't block the writer with WAL, and syncing only at the
+    # checkpoints is still safe with it
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['OPTIONS'].update({
+        'transaction_mode': 'IMMEDIATE',
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/ref/settings/#caches
+
+NORA_CACHE_DIR = environ.get('NORA_CACHE_DIR', str(BASE_DIR / 'cache')) #directory of the cache shared by the web process and the worker
+
+# the worker expires the cached pages when it sends or archives orders, so
+# the cache is kept in files next to the database instead of in each process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': NORA_CACHE_DIR,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
     }
 }
 
@@ -107,6 +146,30 @@ NORA_ONLY_LOCALS = environ.get('NORA_ONLY_LOCALS', 'False').lower() in ['true',
 # if true, it will use Slackbot reminders to send the message, otherwise it will send a DM.
 # it will also hinder much of the functionality of the app.
 SLACK_USE_REMINDERS = environ.get('SLACK_USE_REMINDERS', 'False').lower() in ['true', '1']
+# seconds that each process keeps the access token in memory before reading it again
+SLACK_TOKEN_CACHE_TTL = 60
+# seconds that the identity hash checked by the protected views is cached
+SLACK_IDENTITY_CACHE_TTL = 60
+# number of messages that are sent to Slack at the same time
+SLACK_CONCURRENCY = max(int(environ.get('SLACK_CONCURRENCY', 8)), 1)
+# Slack API tiers as (calls per minute, burst), the budget is shared by all the workers
+# through Redis, set the backend to 'local' to keep a separate budget in each process
+SLACK_RATE_LIMITS = {
+    'chat.postMessage': (600, 20),
+    'chat.update': (50, 20),
+    'chat.delete': (50, 20),
+    'reminders.add': (20, 5),
+    'users.list': (20, 5),
+}
+SLACK_RATE_LIMIT_BACKEND = environ.get('SLACK_RATE_LIMIT_BACKEND', 'redis')
+# seconds a worker may sleep waiting for the rate limiter, longer waits defer the task
+SLACK_RATE_LIMIT_MAX_WAIT = 5
+# rate-limited tasks are retried with an exponential backoff, in seconds, bounded by the max
+SLACK_RETRY_BACKOFF = 2
+SLACK_RETRY_BACKOFF_MAX = 300
+SLACK_MAX_RETRIES = 10
+# number of users requested on each page of the user discovery, Slack recommends 200 or less
+SLACK_USERS_PAGE_SIZE = max(min(int(environ.get('SLACK_USERS_PAGE_SIZE', 200)), 1000), 1)
 
 # Nora's config
 # All times are local time
@@ -114,6 +177,18 @@ SLACK_USE_REMINDERS = environ.get('SLACK_USE_REMINDERS', 'False').lower() in ['t
 NORA_URL = environ.get('NORA_URL', 'https://nora.cornershop.io')
 NORA_NOTIFY_HOUR = max(min(int(environ.get('NORA_NOTIFY_HOUR', 7)), 23), -1) #menus set to a date in the future will notify employees at this time, set to -1 to notify immediately
 NORA_NOTIFY_MINUTE = max(min(int(environ.get('NORA_NOTIFY_MINUTE', 0)), 59), 0) #integer between 0-59
+NORA_SYNC_MINUTES = max(int(environ.get('NORA_SYNC_MINUTES', 60)), 1) #minutes between each refresh of the employee directory
+NORA_REMINDER_CHUNK_SIZE = max(int(environ.get('NORA_REMINDER_CHUNK_SIZE', 500)), 1) #reminders sent by each worker task
+NORA_REMINDER_BATCH_SIZE = max(int(environ.get('NORA_REMINDER_BATCH_SIZE', 100)), 1) #reminders that are sent and saved together
+NORA_DATE_PICKER_DAYS = max(int(environ.get('NORA_DATE_PICKER_DAYS', 30)), 1) #latest days with orders listed by the order list
+NORA_PAGE_CACHE_SECONDS = max(int(environ.get('NORA_PAGE_CACHE_SECONDS', 86400)), 0) #seconds that the order list of a closed day is kept in the cache
+NORA_LIVE_BACKEND = environ.get('NORA_LIVE_BACKEND', 'redis') #'redis' shares the live order events between processes, 'local' keeps them in the process
+NORA_LIVE_STREAM_SECONDS = max(int(environ.get('NORA_LIVE_STREAM_SECONDS', 300)), 1) #seconds before a live order stream is renewed by the browser
+NORA_PAGE_SIZE = max(int(environ.get('NORA_PAGE_SIZE', 100)), 1) #rows in each page of the menu list and the order tables
+NORA_API_PAGE_SIZE = max(int(environ.get('NORA_API_PAGE_SIZE', 100)), 1) #maximum rows in each page of the JSON API
+NORA_ARCHIVE_DAYS = max(int(environ.get('NORA_ARCHIVE_DAYS', 365)), 0) #days that the orders stay in the database before being archived, 0 keeps them forever
+NORA_ARCHIVE_DIR = environ.get('NORA_ARCHIVE_DIR', str(BASE_DIR / 'archive')) #directory of the archived orders
+NORA_ARCHIVE_CHUNK_SIZE = max(int(environ.get('NORA_ARCHIVE_CHUNK_SIZE', 1000)), 1) #orders that are read, written and deleted together when archiving
 NORA_THRESHOLD = max(min(int(environ.get('NORA_THRESHOLD', 11)), 23), 0) #integer between 0-23 that represents the hour up until employees can send orders
 
 if NORA_NOTIFY_HOUR >= NORA_THRESHOLD:
@@ -123,11 +198,24 @@ if NORA_NOTIFY_HOUR >= NORA_THRESHOLD:
 
 from celery.schedules import crontab
 CELERY_BROKER_URL = 'redis://' + environ.get('NORA_REDIS_SERVER', 'localhost:6379/0')
+# the chunks of reminders report to a chord callback, which needs a result backend
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+
+CELERY_BEAT_SCHEDULE = {
+    'sync_employees': {
+        'task': 'menu.tasks.sync_employees',
+        'schedule': NORA_SYNC_MINUTES * 60
+    }
+}
+
+if NORA_ARCHIVE_DAYS > 0:
+    CELERY_BEAT_SCHEDULE['archive_orders'] = {
+        'task': 'menu.tasks.archive_orders',
+        'schedule': crontab(minute=0, hour=3)
+    }
 
 if NORA_NOTIFY_HOUR >= 0:
-    CELERY_BEAT_SCHEDULE = {
-        'send_reminders': {
-            'task': 'menu.tasks.send_reminders',
-            'schedule': crontab(minute=NORA_NOTIFY_MINUTE, hour=NORA_NOTIFY_HOUR)
-        }
+    CELERY_BEAT_SCHEDULE['send_reminders'] = {
+        'task': 'menu.tasks.send_reminders',
+        'schedule': crontab(minute=NORA_NOTIFY_MINUTE, hour=NORA_NOTIFY_HOUR)
     }
\ No newline at end of file
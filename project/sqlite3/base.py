@@ -0,0 +1,30 @@
+"""SQLite backend for the web process and the Celery worker writing to the
+same database. It accepts two more OPTIONS:
+
+- pragmas: a dict of PRAGMA statements run on every new connection, like
+  {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}.
+- transaction_mode: 'IMMEDIATE' makes the transactions take the write lock
+  when they begin. A deferred transaction that reads and then writes can't
+  wait for the lock and fails right away with "database is locked".
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.transaction_mode = kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
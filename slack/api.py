@@ -1,17 +1,31 @@
 import logging
-import time
 
-from typing import List, Dict, Tuple, Optional, Iterable
+from typing import List, Dict, Tuple, Optional, Iterator
 from urllib.parse import urlencode
 from django.conf import settings
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
-from .auth import get_access_token
+from .client import get_client
+from .ratelimit import get_rate_limiter, RateLimitExceeded
 
 logger = logging.getLogger(__name__)
 
 
+def _wait_for_budget(method: str):
+    """Paces the call with the shared rate limiter. Short waits are slept,
+    longer ones raise RateLimitExceeded so the task can be deferred instead
+    of holding the worker"""
+    get_rate_limiter().acquire(
+        method, max_wait=settings.SLACK_RATE_LIMIT_MAX_WAIT)
+
+def _raise_if_rate_limited(method: str, error: SlackApiError):
+    """Turns Slack's rate limit errors into RateLimitExceeded"""
+    if error.response['error'] == 'ratelimited':
+        retry_after = float(error.response.headers.get('Retry-After', 1))
+        logger.info(f'{method} was rate-limited for {retry_after}s')
+        raise RateLimitExceeded(method, retry_after)
+
 def get_add_link() -> str:
     """Returns a url that starts the OAuth2 process"""
     URL = 'https://slack.com/oauth/v2/authorize'
@@ -39,18 +53,34 @@ def exchange_auth_code(code: str) -> Dict:
         logger.error(f'exchange_auth_code: {e.response["error"]}')
         raise ValueError(e.response['error'])
 
-def get_users() -> Iterable:
-    try:
-        client = WebClient(token=get_access_token())
-        response = client.users_list()
-        members = response.get('members')
-        filtered_members = filter(lambda u: u.get('name') != 'slackbot' and u.get('is_bot') == False, members)
-        if settings.NORA_ONLY_LOCALS:
-            filtered_members = filter(lambda u: u.get('tz') == settings.TIME_ZONE, filtered_members)
-        return map(lambda u: (u.get('id'), u.get('real_name')), filtered_members)
-    except SlackApiError as e:
-        logger.error(f'get_users: {e.response["error"]}')
-        return []
+def get_member_pages(limit: Optional[int]=None) -> Iterator[List[Dict]]:
+    """Walks every page of the workspace members following Slack's cursor.
+    Each page keeps only the fields that the service uses, so the full
+    profiles are discarded as soon as the page arrives. Errors are raised so
+    the caller can tell a complete walk from a truncated one. Rate limits
+    raise RateLimitExceeded"""
+    limit = limit or settings.SLACK_USERS_PAGE_SIZE
+    client = get_client()
+    params = {'limit': limit}
+    while True:
+        _wait_for_budget('users.list')
+        try:
+            response = client.users_list(**params)
+        except SlackApiError as e:
+            _raise_if_rate_limited('users.list', e)
+            raise
+        yield [{
+            'id': u.get('id'),
+            'real_name': u.get('real_name'),
+            'tz': u.get('tz'),
+            'deleted': u.get('deleted', False)
+        } for u in response.get('members', [])
+            if u.get('name') != 'slackbot' and u.get('is_bot') == False]
+        metadata = response.get('response_metadata') or {}
+        cursor = metadata.get('next_cursor')
+        if not cursor:
+            break
+        params['cursor'] = cursor
 
 def __send_private_message(channel: str, text: str, ts: str=None) -> Tuple[str, str]:
     """Private function to send messages to users or channels. The message is
@@ -64,38 +94,42 @@ def __send_private_message(channel: str, text: str, ts: str=None) -> Tuple[str,
     if ts is not None:
         method = 'chat.update'
         params.update({'ts': ts})
-    client = WebClient(token=get_access_token())
+    client = get_client()
+    _wait_for_budget(method)
     response = client.api_call(method, json=params)
     return (response.get('channel'), response.get('ts'))
 
 def send_private_message(channel: str, text: str, ts: Optional[str]=None) -> Tuple:
-    """Wrapper around the previous function that allow it to overcome rate
-    limitations"""
+    """Wrapper around the previous function that handles the errors. The
+    calls are paced by the shared rate limiter, if the budget runs out or
+    Slack rate-limits us anyway it raises RateLimitExceeded, so the task
+    can retry later without blocking the worker"""
     try:
         return __send_private_message(channel, text, ts)
     except SlackApiError as e:
-        if e.response['error'] == 'ratelimited':
-            logger.info(f'send_private_message was rate-limited, waiting')
-            delay = int(e.response.headers['Retry-After'])
-            time.sleep(delay)
-            return __send_private_message(channel, text, ts)
-        else:
-            logger.error(f'send_private_message: {e.response["error"]}')
-            return (None, None)
+        _raise_if_rate_limited(
+            'chat.update' if ts is not None else 'chat.postMessage', e)
+        logger.error(f'send_private_message: {e.response["error"]}')
+        return (None, None)
 
 def delete_message(channel: str, ts: str) -> bool:
     try:
-        client = WebClient(token=get_access_token())
+        client = get_client()
+        _wait_for_budget('chat.delete')
         client.chat_delete(channel=channel, ts=ts)
         return True
     except SlackApiError as e:
+        _raise_if_rate_limited('chat.delete', e)
         logger.error(f'delete_message: {e.response["error"]}')
         return False
 
 def create_reminder(user_id: str, text: str) -> bool:
     try:
+        client = get_client()
+        _wait_for_budget('reminders.add')
         client.reminders_add(text=text, user=user_id, time='in 1 second')
         return True
     except SlackApiError as e:
+        _raise_if_rate_limited('reminders.add', e)
         logger.error(f'create_reminder: {e.response["error"]}')
         return False
\ No newline at end of file
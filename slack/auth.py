@@ -1,7 +1,12 @@
 import logging
 import functools
+import time
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.http import HttpResponseRedirect, HttpRequest
 
 from .models import SlackIdentity
@@ -10,6 +15,13 @@ logger = logging.getLogger(__name__)
 
 SESSION_KEY = 'file_key'
 
+# the access token is read on every Slack call, so each process keeps it
+_token_cache = {'token': None, 'expires': 0}
+
+# the identity hash is checked on every protected view
+IDENTITY_CACHE_KEY = 'slack:identity_hash'
+identity_cache_stats = {'hits': 0, 'misses': 0}
+
 
 def create_identity(id_dict: dict, request: HttpRequest):
     SlackIdentity.objects.create(**id_dict)
@@ -26,24 +38,35 @@ def are_identities_equal(id_dict: dict) -> bool:
 
 
 def setup_session(request: HttpRequest):
-    key = SlackIdentity.get_identity_hash()
+    key = get_identity_hash()
     request.session[SESSION_KEY] = key
 
 
+def get_identity_hash() -> str:
+    """Returns the hash of the installed identity, or an empty string if
+    there's none. It's kept in Django's cache and invalidated when the
+    identity changes, so protected views don't query the database"""
+    id_hash = cache.get(IDENTITY_CACHE_KEY)
+    if id_hash is not None:
+        identity_cache_stats['hits'] += 1
+        return id_hash
+    identity_cache_stats['misses'] += 1
+    try:
+        id_hash = SlackIdentity.objects.get(pk=1).identity_hash
+    except SlackIdentity.DoesNotExist as _:
+        id_hash = ''
+    cache.set(IDENTITY_CACHE_KEY, id_hash, settings.SLACK_IDENTITY_CACHE_TTL)
+    return id_hash
+
+
 def identity_exists() -> bool:
     """Ensures the identity record exists and it's only one"""
     return SlackIdentity.objects.count() == 1
 
 
 def check_user_identity(request) -> bool:
-    try:
-        if identity_exists():
-            id_key = request.session.get(SESSION_KEY)
-            id_hash = SlackIdentity.get_identity_hash()
-            return id_key == id_hash
-    except SlackIdentity.DoesNotExist as _:
-        pass
-    return False
+    id_hash = get_identity_hash()
+    return bool(id_hash) and request.session.get(SESSION_KEY) == id_hash
 
 
 def has_valid_session(request: HttpRequest) -> bool:
@@ -53,18 +76,33 @@ def has_valid_session(request: HttpRequest) -> bool:
     key = request.session.get(SESSION_KEY)
     if not key:
         return False
-    if not identity_exists():
-        return False
-    if key != SlackIdentity.get_identity_hash():
-        return False
-    return True
+    return key == get_identity_hash()
 
 
 def get_access_token():
+    """Returns the access token of the installed identity. It's cached in
+    memory and invalidated when the identity is saved or deleted in this
+    process, other processes pick up the change after SLACK_TOKEN_CACHE_TTL
+    seconds"""
+    now = time.monotonic()
+    if _token_cache['expires'] > now:
+        return _token_cache['token']
     identity = SlackIdentity.load()
+    _token_cache.update({
+        'token': identity.access_token,
+        'expires': now + settings.SLACK_TOKEN_CACHE_TTL
+    })
     return identity.access_token
 
 
+@receiver(post_save, sender=SlackIdentity)
+@receiver(post_delete, sender=SlackIdentity)
+def invalidate_identity_cache(**kwargs):
+    """Called on install, re-authorization and uninstall"""
+    _token_cache['expires'] = 0
+    cache.delete(IDENTITY_CACHE_KEY)
+
+
 def delete_session(request):
     try:
         del request.session[SESSION_KEY]
@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+
+from http.client import (HTTPConnection, HTTPSConnection, HTTPException,
+                         RemoteDisconnected)
+from typing import Dict
+from urllib.parse import urlencode, urlsplit
+from slack_sdk import WebClient
+
+from .auth import get_access_token
+
+# errors raised when a kept-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (RemoteDisconnected, BrokenPipeError,
+                           ConnectionResetError)
+
+
+class PooledWebClient(WebClient):
+    """A WebClient that keeps its HTTP connections open between calls
+    instead of opening a new one (and doing a new TLS handshake) for every
+    message. Each thread has its own connections so the client can be
+    shared by the dispatch threads. Proxies and file uploads are left to
+    the regular client."""
+    def __init__(self, *args, **kwargs):
+        super(PooledWebClient, self).__init__(*args, **kwargs)
+        self._local = threading.local()
+
+    def _get_connection(self, scheme: str, netloc: str):
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            if scheme == 'https':
+                conn = HTTPSConnection(
+                    netloc, timeout=self.timeout, context=self.ssl)
+            else:
+                conn = HTTPConnection(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = conn
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str):
+        connections = self._local.__dict__.get('connections', {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _perform_urllib_http_request(
+            self, *, url: str, args: Dict[str, Dict[str, any]]) -> Dict[str, any]:
+        if self.proxy or args['data'] or not url.lower().startswith('http'):
+            return super(PooledWebClient, self)._perform_urllib_http_request(
+                url=url, args=args)
+        headers = dict(args['headers'])
+        body = None
+        if args['json']:
+            body = json.dumps(args['json']).encode('utf-8')
+            headers['Content-Type'] = 'application/json;charset=utf-8'
+        elif args['params']:
+            body = urlencode(args['params']).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        parts = urlsplit(url)
+        path = f'{parts.path}?{parts.query}' if parts.query else parts.path
+        scheme, netloc = parts.scheme.lower(), parts.netloc
+
+        reused = (scheme, netloc) in self._local.__dict__.get('connections', {})
+        conn = self._get_connection(scheme, netloc)
+        try:
+            conn.request('POST', path, body=body, headers=headers)
+            resp = conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            # the server closed the idle connection, try once on a new one
+            self._drop_connection(scheme, netloc)
+            if not reused:
+                raise
+            conn = self._get_connection(scheme, netloc)
+            conn.request('POST', path, body=body, headers=headers)
+            resp = conn.getresponse()
+        except (HTTPException, OSError):
+            self._drop_connection(scheme, netloc)
+            raise
+
+        data = resp.read()
+        if resp.will_close:
+            self._drop_connection(scheme, netloc)
+        response = {'status': resp.status, 'headers': resp.headers}
+        if resp.status == 429:
+            # for compatibility with the regular client
+            response['headers']['Retry-After'] = resp.headers['retry-after']
+        if resp.headers.get_content_type() == 'application/gzip':
+            response['body'] = data
+        else:
+            charset = resp.headers.get_content_charset() or 'utf-8'
+            response['body'] = data.decode(charset)
+        return response
+
+
+_client = {'pid': None, 'token': None, 'client': None}
+_client_lock = threading.Lock()
+
+
+def get_client() -> PooledWebClient:
+    """Returns the client of this process, so the connections are reused
+    by every call. It's rebuilt when the access token changes, and after a
+    fork so each Celery child process gets its own connections."""
+    token = get_access_token()
+    with _client_lock:
+        if (_client['client'] is None or _client['pid'] != os.getpid() or
+                _client['token'] != token):
+            _client.update({
+                'pid': os.getpid(),
+                'token': token,
+                'client': PooledWebClient(token=token)
+            })
+        return _client['client']
@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Iterator, Tuple, Any, Optional
+from django.conf import settings
+
+_DONE = object()
+
+
+class Throughput:
+    """Keeps track of how many calls were made and how long they took"""
+    def __init__(self):
+        self.count = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'seconds': round(self.elapsed, 3),
+            'per_second': round(self.rate, 2)
+        }
+
+
+_executor = {'pid': None, 'size': 0, 'executor': None}
+_executor_lock = threading.Lock()
+
+
+def get_executor(size: int) -> ThreadPoolExecutor:
+    """Returns the thread pool of this process, so its threads and the
+    connections they keep alive are reused by every dispatch. It's rebuilt
+    when a bigger pool is needed, and after a fork so each Celery child
+    process gets its own threads."""
+    with _executor_lock:
+        if (_executor['executor'] is None or _executor['pid'] != os.getpid()
+                or _executor['size'] < size):
+            # a dispatch that is using the old pool keeps it until it ends,
+            # its threads exit once it's collected
+            _executor.update({
+                'pid': os.getpid(),
+                'size': size,
+                'executor': ThreadPoolExecutor(
+                    max_workers=size, thread_name_prefix='dispatch')
+            })
+        return _executor['executor']
+
+
+def dispatch(func: Callable, jobs: Iterable, concurrency: Optional[int]=None,
+             throughput: Optional[Throughput]=None) -> Iterator[Tuple[Any, Any]]:
+    """Calls func for every job in the thread pool of the process, keeping
+    at most `concurrency` calls in flight. The jobs are consumed lazily from
+    the calling thread and the (job, result) pairs are yielded back to it as
+    soon as each call finishes, so any database work on the results stays
+    in the calling thread. If a call raises, the remaining jobs are not
+    started, the calls in flight are still yielded as they finish and then
+    the exception is raised."""
+    concurrency = concurrency or settings.SLACK_CONCURRENCY
+    executor = get_executor(max(concurrency, settings.SLACK_CONCURRENCY))
+    jobs = iter(jobs)
+    error = None
+    pending = {}
+
+    def submit():
+        while error is None and len(pending) < concurrency:
+            job = next(jobs, _DONE)
+            if job is _DONE:
+                break
+            pending[executor.submit(func, job)] = job
+
+    try:
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if throughput is not None:
+                    throughput.count += 1
+                yield job, result
+            submit()
+    finally:
+        # if the caller stops early the calls in flight still finish first
+        wait(pending)
+    if error is not None:
+        raise error
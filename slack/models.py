@@ -32,10 +32,13 @@ class SlackIdentity(models.Model):
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
 
-    @classmethod
-    def get_identity_hash(cls):
-        identity = cls.load()
+    @property
+    def identity_hash(self):
         hasher = sha1()
-        line = identity.user_id+identity.team_id+identity.access_token
+        line = self.user_id+self.team_id+self.access_token
         hasher.update(line.encode('utf-8'))
         return hasher.hexdigest()
+
+    @classmethod
+    def get_identity_hash(cls):
+        return cls.load().identity_hash
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+import functools
+
+from typing import Optional, Tuple
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Token bucket in Redis. The bucket is refilled with the time elapsed since
+# the last call and a token is reserved even if the bucket is empty, the
+# caller then waits until its token is due. When the wait is longer than
+# max_wait nothing is reserved so the caller can give up and come back later.
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+local granted = 1
+if max_wait >= 0 and wait > max_wait then
+    granted = 0
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return {granted, tostring(wait)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """The call can't be made before retry_after seconds"""
+    def __init__(self, method: str, retry_after: float):
+        super().__init__(f'{method} is rate limited for {retry_after:.2f}s')
+        self.method = method
+        self.retry_after = retry_after
+
+
+class LocalBackend:
+    """Keeps the buckets in memory, every process has its own budget.
+    Useful for tests and single process deployments."""
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int,
+             max_wait: float) -> Tuple[bool, float]:
+        with self.lock:
+            now = time.monotonic()
+            tokens, ts = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0, now - ts) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0.0
+            granted = max_wait < 0 or wait <= max_wait
+            if granted:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            return granted, wait
+
+
+class RedisBackend:
+    """Keeps the buckets in Redis, so every worker shares the same budget.
+    If Redis can't be reached it falls back to a local bucket instead of
+    stopping the messages."""
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.fallback = LocalBackend()
+
+    def take(self, key: str, rate: float, burst: int,
+             max_wait: float) -> Tuple[bool, float]:
+        import redis
+        try:
+            granted, wait = self.script(
+                keys=[key], args=[rate, burst, max_wait])
+            return bool(granted), float(wait)
+        except redis.RedisError as e:
+            logger.warning(f'rate limiter is using a local bucket: {e}')
+            return self.fallback.take(key, rate, burst, max_wait)
+
+
+class RateLimiter:
+    """Paces the calls to the Slack API according to the tier of each
+    method, set in SLACK_RATE_LIMITS as (calls per minute, burst). Methods
+    without a tier are not limited."""
+    prefix = 'nora:ratelimit:'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def acquire(self, method: str, max_wait: Optional[float]=None) -> float:
+        """Blocks until the method can be called and returns the seconds it
+        waited. If max_wait is set and the wait would be longer, it raises
+        RateLimitExceeded right away without consuming the budget."""
+        limit = settings.SLACK_RATE_LIMITS.get(method)
+        if limit is None:
+            return 0.0
+        per_minute, burst = limit
+        granted, wait = self.backend.take(
+            self.prefix + method, per_minute / 60, burst,
+            -1 if max_wait is None else max_wait)
+        if not granted:
+            raise RateLimitExceeded(method, wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+@functools.lru_cache()
+def _build_rate_limiter(backend: str, url: str) -> RateLimiter:
+    if backend == 'local':
+        return RateLimiter(LocalBackend())
+    return RateLimiter(RedisBackend(url))
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the rate limiter for this process"""
+    return _build_rate_limiter(settings.SLACK_RATE_LIMIT_BACKEND,
+                               settings.CELERY_BROKER_URL)
@@ -0,0 +1,54 @@
+// Keeps the order list up to date with the events of the order stream, the
+// rows are patched in place so the page never needs to be reloaded.
+
+function refreshTable(tbody) {
+    const rows = Array.prototype.slice.call(tbody.querySelectorAll('tr[id^="order-"]'), 0);
+    rows.forEach((row, i) => {
+        row.cells[0].textContent = i + 1;
+    });
+    tbody.querySelector('.is-empty').classList.toggle('is-hidden', rows.length > 0);
+}
+
+function updatePending(delta) {
+    const $count = document.getElementById('pending-count');
+    const count = Math.max(parseInt($count.textContent, 10) + delta, 0);
+    $count.textContent = count;
+    document.getElementById('pending-orders').classList.toggle('is-hidden', count === 0);
+}
+
+function patchOrder(order) {
+    if (order.previous === 'pending' && order.state !== 'pending') {
+        updatePending(-1);
+    }
+    const $old = document.getElementById('order-' + order.id);
+    if ($old && order.state === order.previous) {
+        // the row stays where it is on its page
+        const tbody = $old.parentNode;
+        $old.insertAdjacentHTML('beforebegin', order.row);
+        $old.remove();
+        refreshTable(tbody);
+        return;
+    }
+    if ($old) {
+        const tbody = $old.parentNode;
+        $old.remove();
+        refreshTable(tbody);
+    }
+    // a paginated table may show another page than the order's, and a table
+    // filtered out by the tabs isn't on the page at all
+    const $tbody = document.getElementById(order.state + '-orders');
+    if ($tbody && !$tbody.hasAttribute('data-paginated')) {
+        $tbody.querySelector('.is-empty').insertAdjacentHTML('beforebegin', order.row);
+        refreshTable($tbody);
+    }
+}
+
+function startBoard(url) {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource(url);
+    source.addEventListener('order', event => {
+        patchOrder(JSON.parse(event.data));
+    });
+}
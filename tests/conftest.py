@@ -0,0 +1,69 @@
+import pytest
+
+from django.urls import reverse
+
+from menu.live import _build_broker
+from menu.pages import expire_pages
+from project.celery import app as celery_app
+from slack.auth import invalidate_identity_cache
+from slack.ratelimit import _build_rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def local_rate_limiter(settings):
+    """Tests don't have Redis, each one gets a fresh in-process budget"""
+    settings.SLACK_RATE_LIMIT_BACKEND = 'local'
+    _build_rate_limiter.cache_clear()
+    yield
+    _build_rate_limiter.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def local_live_broker(settings):
+    """The order events are delivered in the test process"""
+    settings.NORA_LIVE_BACKEND = 'local'
+    _build_broker.cache_clear()
+    yield
+    _build_broker.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def temporary_cache(settings, tmp_path_factory):
+    """Each test gets an empty cache directory"""
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(tmp_path_factory.mktemp('cache')),
+        }
+    }
+
+
+@pytest.fixture(autouse=True)
+def clean_identity_cache(temporary_cache):
+    """The database is rolled back between tests without any signal"""
+    invalidate_identity_cache()
+    yield
+    invalidate_identity_cache()
+
+
+@pytest.fixture(autouse=True)
+def clean_pages_cache(temporary_cache):
+    """Cached pages would outlive the rolled back orders"""
+    expire_pages()
+
+
+@pytest.fixture(autouse=True, scope='session')
+def eager_celery():
+    """Runs the tasks and their chords synchronously"""
+    celery_app.conf.task_always_eager = True
+
+
+@pytest.fixture
+def auth_client(mocker, client):
+    """A client logged in through the Slack sign in"""
+    mocker.patch('slack.views.exchange_auth_code',
+                 return_value={'user_id': 'a',
+                               'team_id': 'a',
+                               'access_token': 'a'})
+    client.get(reverse('slack:auth')+'?code=dfg')
+    return client
@@ -0,0 +1,92 @@
+import pytest
+
+from django.urls import reverse
+from django.utils.timezone import now
+
+from menu.models import Order
+from menu.pagination import encode_cursor, decode_cursor
+from .utils import setup_models
+
+
+pytestmark = pytest.mark.django_db
+
+
+def send(orders, selected=None):
+    for order in orders:
+        order.sent = now()
+        order.selected = selected
+        order.save()
+
+
+def walk(client, url):
+    """Follows the cursors and returns every row"""
+    rows, cursor = [], ''
+    while cursor is not None:
+        res = client.get(url + f'&cursor={cursor}')
+        assert res.status_code == 200
+        rows += res.json()['results']
+        cursor = res.json()['next']
+    return rows
+
+
+def test_protected(client):
+    for name in ['api-order-list', 'api-menu-list']:
+        assert client.get(reverse(f'menu:{name}')).status_code == 403
+
+
+def test_cursor():
+    values = [now(), now().date(), 'a', 1]
+    decoded = decode_cursor(encode_cursor(values), 4)
+    assert decoded == [values[0].isoformat(), values[1].isoformat(), 'a', 1]
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(values), 3)
+    with pytest.raises(ValueError):
+        decode_cursor('nope', 4)
+
+
+def test_orders_pages(auth_client):
+    menu, orders = setup_models(days=1, orders=7)
+    send(orders)
+    # orders created at the same time are ordered by id
+    Order.objects.filter(pk__in=[o.pk for o in orders[:4]]).update(
+        created=orders[0].created)
+    _, unsent = setup_models(days=1)
+    rows = walk(auth_client, reverse('menu:api-order-list') + '?limit=2')
+    expected = Order.objects.sent().order_by('date', 'created', 'id')
+    assert [r['id'] for r in rows] == [str(o.pk) for o in expected]
+    assert set(rows[0]) == {
+        'id', 'employee_slack_id', 'employee_real_name', 'menu', 'date',
+        'selected', 'notes', 'created', 'modified', 'sent', 'fulfilled'}
+
+
+def test_orders_filters(auth_client):
+    menu, orders = setup_models(days=1, orders=3)
+    send(orders[:2], selected='a')
+    send(orders[2:])
+    other, other_orders = setup_models(days=2, orders=2)
+    send(other_orders, selected='a')
+    url = reverse('menu:api-order-list')
+    res = auth_client.get(
+        url + f'?d={menu.date:%Y%m%d}&state=active&fields=id,selected')
+    assert res.json() == {
+        'results': [{'id': str(o.pk), 'selected': 'a'} for o in orders[:2]],
+        'next': None}
+    res = auth_client.get(url + '?state=pending&fields=id')
+    assert res.json()['results'] == [{'id': str(orders[2].pk)}]
+
+
+def test_bad_requests(auth_client):
+    url = reverse('menu:api-order-list')
+    for query in ['?state=lost', '?fields=id,password', '?limit=a',
+                  '?cursor=nope', f'?cursor={encode_cursor(["a", "b", "c"])}']:
+        assert auth_client.get(url + query).status_code == 400
+
+
+def test_menus(auth_client):
+    menus = [setup_models(days=d)[0] for d in (3, 1, 2)]
+    deleted, _ = setup_models(days=1)
+    deleted.to_be_deleted = True
+    deleted.save()
+    rows = walk(auth_client, reverse('menu:api-menu-list') + '?limit=1')
+    assert [r['id'] for r in rows] == [menus[1].id, menus[2].id, menus[0].id]
+    assert rows[0]['options'] == ['a', 'b', 'c']
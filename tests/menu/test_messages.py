@@ -0,0 +1,57 @@
+import pytest
+
+from itertools import product
+from django.template.loader import get_template
+from django.utils.timezone import localtime, now
+from datetime import timedelta
+from django.conf import settings
+
+from menu.messages import MenuMessage
+from menu.models import Order
+from .utils import setup_models
+
+
+pytestmark = pytest.mark.django_db
+
+
+def render_template(order):
+    """The message as it was rendered before MenuMessage"""
+    template = get_template('order_message.txt')
+    return template.render({
+        'order': order,
+        'today': order._today.date(),
+        'nora_url': settings.NORA_URL
+    })
+
+
+def test_same_as_template(settings):
+    settings.NORA_URL = 'https://nora.example.com/?a=1&b=2'
+    settings.NORA_THRESHOLD = 23
+    for days in [0, 1]:
+        menu, order = setup_models(days=days)
+        menu.options = ['Fish & <chips>', 'b', 'c']
+        message = MenuMessage(menu)
+        states = product(
+            [None, 'Fish & <chips>', 'c', 'missing'],
+            [None, '', 'no "salt" & <pepper>'],
+            [None, now()],
+            ['Unique User', 'Tom & <Jerry>'])
+        for selected, notes, fulfilled, name in states:
+            order.selected = selected
+            order.notes = notes
+            order.fulfilled = fulfilled
+            order.employee_real_name = name
+            assert message.render(order) == render_template(order)
+
+
+def test_no_menu():
+    order = Order(employee_slack_id='a', employee_real_name='b',
+                  date=localtime(now()).date())
+    assert MenuMessage().render(order) == render_template(order)
+
+
+def test_today_follows_the_clock(mocker):
+    menu, order = setup_models(days=1)
+    assert 'today' not in MenuMessage(menu).render(order)
+    mocker.patch('menu.messages.now', return_value=now() + timedelta(days=1))
+    assert 'today' in MenuMessage(menu).render(order)
@@ -1,5 +1,6 @@
 import pytest
-from menu.models import Menu, Order
+from menu.models import Menu, Order, OrderDate
+from menu.pages import pages_version
 from django.utils.timezone import localtime, now
 from django.db import IntegrityError
 from django.core.exceptions import ValidationError
@@ -40,6 +41,37 @@ class TestMenuModel:
         assert 'options' in str(exc.value)
 
 
+    def test_cascade_date(self, django_assert_num_queries):
+        menu, order = setup_models(days=1)
+        menu = Menu.objects.get(pk=menu.pk)
+        menu.to_be_deleted = True
+        # only the menu is written
+        with django_assert_num_queries(1):
+            menu.save(update_fields=['to_be_deleted'])
+        menu.options.append('d')
+        with django_assert_num_queries(1):
+            menu.save()
+        menu.refresh_from_db()
+        assert menu.changed_fields() == set()
+        menu.date += timedelta(days=1)
+        with django_assert_num_queries(2):
+            menu.save()
+        order.refresh_from_db()
+        assert order.date == menu.date
+
+    def test_cascade_sent_date(self):
+        menu, order = setup_models(days=1)
+        order.sent = now()
+        order.save()
+        menu.sent = now()
+        menu.save()
+        menu = Menu.objects.get(pk=menu.pk)
+        menu.date += timedelta(days=1)
+        menu.save()
+        # the old day has no sent orders left, so the picker drops it
+        assert list(OrderDate.objects.values_list('date', flat=True)) == [
+            menu.date]
+
 class TestOrderModel:
     def test_copy_menu_date(self):
         menu, order = setup_models()
@@ -51,6 +83,20 @@ class TestOrderModel:
         assert order.menu == None
         assert order.date == valid_date
 
+    def test_save_without_menu_fetch(self, django_assert_num_queries):
+        menu, order = setup_models()
+        order = Order.objects.get(pk=order.pk)
+        order.selected = 'a'
+        # the menu isn't loaded to copy its date
+        with django_assert_num_queries(1):
+            order.save(update_fields=['selected'])
+        other, _ = setup_models(days=2)
+        order.menu_id = other.id
+        with django_assert_num_queries(2):
+            order.save(update_fields=['menu'])
+        order.refresh_from_db()
+        assert order.date == other.date
+
     def test_reminder_text_today(self, settings):
         # sets the threshold to the next hour so we can create
         # orders for today
@@ -71,4 +117,25 @@ class TestOrderModel:
         _, order = setup_models(days=0)
         assert order.is_expired, 'orders created after the threshold should be expired'
         order.date = (localtime(now()) - timedelta(days=2)).date()
-        assert order.is_expired, 'orders created in the past are expired'
\ No newline at end of file
+        assert order.is_expired, 'orders created in the past are expired'
+
+    def test_is_expired_follows_the_clock(self, mocker):
+        _, order = setup_models(days=1)
+        assert not order.is_expired
+        # a process started before the order's day is still running after it
+        mocker.patch('django.utils.timezone.now',
+                     return_value=now() + timedelta(days=2))
+        assert order.is_expired
+
+class TestOrderDateModel:
+    def test_record_expires_new_dates(self):
+        today = localtime(now()).date()
+        version = pages_version()
+        OrderDate.objects.record([today])
+        assert pages_version() != version
+        version = pages_version()
+        OrderDate.objects.record([today, today])
+        assert pages_version() == version, 'known dates keep the cached pages'
+        OrderDate.objects.record(iter([today, today + timedelta(days=1)]))
+        assert pages_version() != version
+        assert OrderDate.objects.count() == 2
@@ -1,10 +1,16 @@
+import gzip
 import pytest
 
+from django.db import IntegrityError
 from django.utils.timezone import now
+from datetime import timedelta
+from urllib.error import URLError
 
-from menu.tasks import (create_orders, notify_menu_change, notify_menu_deleted,
-    update_order, send_reminders)
-from menu.models import Menu, Order
+from menu.tasks import (retry_later, create_orders, notify_menu_change, notify_menu_deleted,
+    update_order, send_reminders, send_reminder_chunk, sync_employees,
+    archive_orders, restore_orders)
+from menu.models import Menu, Order, OrderDate, Employee
+from slack.ratelimit import RateLimitExceeded
 from .utils import setup_models
 
 
@@ -14,39 +20,111 @@ pytestmark = pytest.mark.django_db
 def test_create_orders(mocker, settings):
     settings.NORA_NOTIFY_HOUR = -1
     menu, order = setup_models(days=1)
-    mocker.patch('menu.tasks.get_users', return_value=[('a', 'b'), ('c', 'd')])
+    Employee.objects.create(slack_id='a', real_name='b')
+    Employee.objects.create(slack_id='c', real_name='d')
+    Employee.objects.create(slack_id='e', real_name='f', is_active=False)
     send_reminders = mocker.patch('menu.tasks.send_reminders')
-    create_orders(menu.id)
-    send_reminders.assert_called_with(menu_id=menu.id)
+    res = create_orders(menu.id)
+    send_reminders.delay.assert_called_with(menu_id=menu.id)
     assert menu.orders.count() == 3
+    assert res == {'created': 2, 'skipped': 0}
+    assert all(o.date == menu.date for o in menu.orders.all())
 
     # multiple calls should not create more orders
-    create_orders(menu.id)
+    res = create_orders(menu.id)
     assert menu.orders.count() == 3
+    assert res == {'created': 0, 'skipped': 2}
+
+def test_create_orders_only_locals(settings):
+    settings.NORA_ONLY_LOCALS = True
+    menu, _ = setup_models(days=1)
+    Employee.objects.create(slack_id='a', real_name='b', tz=settings.TIME_ZONE)
+    Employee.objects.create(slack_id='c', real_name='d', tz='Oceania')
+    create_orders(menu.id)
+    assert menu.orders.filter(employee_slack_id='a').exists()
+    assert not menu.orders.filter(employee_slack_id='c').exists()
+
+def test_create_orders_first_sync(mocker):
+    menu, _ = setup_models(days=1)
+    mocker.patch('menu.tasks.get_member_pages', return_value=[[
+        {'id': 'a', 'real_name': 'b', 'tz': None, 'deleted': False}]])
+    res = create_orders(menu.id)
+    assert res['created'] == 1
+    assert Employee.objects.count() == 1
+
+def test_sync_employees(mocker):
+    Employee.objects.create(slack_id='a', real_name='Old Name')
+    Employee.objects.create(slack_id='b', real_name='Gone')
+    Employee.objects.create(slack_id='c', real_name='Same', tz='UTC')
+    pages = [
+        [{'id': 'a', 'real_name': 'New Name', 'tz': 'UTC', 'deleted': False},
+         {'id': 'c', 'real_name': 'Same', 'tz': 'UTC', 'deleted': False}],
+        [{'id': 'd', 'real_name': 'New Hire', 'tz': 'UTC', 'deleted': False},
+         {'id': 'e', 'real_name': 'Deleted', 'tz': 'UTC', 'deleted': True}]
+    ]
+    mocker.patch('menu.tasks.get_member_pages', return_value=pages)
+    res = sync_employees()
+    assert res == {'created': 2, 'updated': 2}
+    assert Employee.objects.get(slack_id='a').real_name == 'New Name'
+    assert not Employee.objects.get(slack_id='b').is_active
+    assert Employee.objects.get(slack_id='d').is_active
+    assert not Employee.objects.get(slack_id='e').is_active
+
+    # nothing changed, nothing is written
+    res = sync_employees()
+    assert res == {'created': 0, 'updated': 0}
+
+def test_unique_order_per_employee():
+    menu, order = setup_models(days=1)
+    with pytest.raises(IntegrityError):
+        Order.objects.create(employee_slack_id=order.employee_slack_id,
+                             employee_real_name='Copy', menu=menu)
 
 def test_notify_menu_change(mocker):
     menu, order = setup_models(days=1)
-    update_order = mocker.patch('menu.tasks.update_order')
-    send_private_message = mocker.patch('menu.tasks.send_private_message')
+    send_private_message = mocker.patch(
+        'menu.tasks.send_private_message', return_value=('a', 'b'))
     order.sent = now()
     order.save()
-    
 
-    # order is not selected. it wont send a message
+    # order is not selected. it will only update the reminder
+    notify_menu_change(menu.id)
+    order.refresh_from_db()
+    send_private_message.assert_called_once_with(
+        None, order.reminder_text, None)
+    assert (order.employee_channel, order.ts) == ('a', 'b')
+    assert order.message_hash is not None
+
+    # the message didn't change, nothing is sent
+    send_private_message.reset_mock()
     notify_menu_change(menu.id)
-    update_order.assert_called_with(order.pk)
     send_private_message.assert_not_called()
 
     order.selected = menu.options[0]
     order.save()
 
-    # order is selected. it will send a message
-    update_order.reset_mock()
+    # order is selected and its option is still there. it will only update
+    # the reminder
+    notify_menu_change(menu.id)
+    send_private_message.assert_called_once_with(
+        'a', order.reminder_text, 'b')
+
+    # the selected option was removed. it will send a message
     send_private_message.reset_mock()
-    
+    menu.options = ['x', 'y']
+    menu.save()
     notify_menu_change(menu.id)
-    update_order.assert_called_with(order.pk)
-    send_private_message.assert_called()
+    assert send_private_message.call_count == 2
+    send_private_message.assert_any_call(
+        'a', Order.objects.get(pk=order.pk).reminder_text, 'b')
+
+def test_update_order_unchanged(mocker):
+    _, order = setup_models()
+    send_private_message = mocker.patch(
+        'menu.tasks.send_private_message', return_value=('a', 'b'))
+    update_order(order.id)
+    update_order(order.id)
+    send_private_message.assert_called_once()
 
 def test_notify_menu_deleted(mocker):
     menu, order = setup_models(days=1)
@@ -57,6 +135,59 @@ def test_notify_menu_deleted(mocker):
     order.save()
     notify_menu_deleted(menu.id)
     delete_message.assert_called_with('a', 'b')
+    assert not Order.objects.filter(pk=order.pk).exists()
+    assert not Menu.objects.filter(pk=menu.id).exists()
+    assert not OrderDate.objects.filter(date=menu.date).exists()
+
+def test_notify_menu_deleted_resume(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    menu, orders = setup_models(days=1, orders=3)
+    for order in orders:
+        order.sent = now()
+        order.selected = 'a'
+        order.save()
+    delete_message = mocker.patch('menu.tasks.delete_message')
+    send_private_message = mocker.patch('menu.tasks.send_private_message',
+        side_effect=[None, RateLimitExceeded('chat.postMessage', 1)])
+    with pytest.raises(RateLimitExceeded):
+        notify_menu_deleted(menu.id)
+    # the first order was cleaned, nothing is deleted yet
+    assert menu.orders.filter(sent__isnull=True).count() == 1
+    assert menu.orders.count() == 3
+
+    send_private_message.side_effect = None
+    delete_message.reset_mock()
+    notify_menu_deleted(menu.id)
+    assert delete_message.call_count == 2
+    assert not Order.objects.exists()
+    assert not Menu.objects.exists()
+
+def test_notify_menu_deleted_progress(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    settings.SLACK_MAX_RETRIES = 0
+    menu, orders = setup_models(days=1, orders=3)
+    for order in orders:
+        order.sent = now()
+        order.save()
+    mocker.patch('menu.tasks.delete_message', side_effect=[
+        None, RateLimitExceeded('chat.delete', 5),
+        None, RateLimitExceeded('chat.delete', 5), None])
+    signature = mocker.spy(notify_menu_deleted, 'signature')
+    # every attempt cleans an order, so it continues without counting retries
+    notify_menu_deleted.apply((menu.id,)).get()
+    assert signature.call_count == 2
+    assert all(c[1]['countdown'] == 5 for c in signature.call_args_list)
+    assert not Order.objects.exists()
+    assert not Menu.objects.exists()
+
+def test_send_reminders_deleted_menu(mocker):
+    menu, order = setup_models()
+    menu.to_be_deleted = True
+    menu.save()
+    send_private_message = mocker.patch('menu.tasks.send_private_message')
+    assert send_reminders(menu_id=menu.id) == {}
+    assert send_reminder_chunk(menu.id, [str(order.pk)])['count'] == 0
+    send_private_message.assert_not_called()
 
 def test_update_order(mocker):
     _, order = setup_models()
@@ -92,4 +223,167 @@ def test_send_reminders(mocker, settings):
     order.refresh_from_db()
     assert order.sent != None
     create_reminder.assert_called_with(order.employee_slack_id, order.reminder_text)
-    send_private_message.assert_not_called()
\ No newline at end of file
+    send_private_message.assert_not_called()
+
+def test_send_reminders_many(mocker, settings):
+    settings.SLACK_CONCURRENCY = 4
+    settings.NORA_REMINDER_CHUNK_SIZE = 4
+    menu, orders = setup_models(orders=10)
+    mocker.patch('menu.tasks.send_private_message', return_value=('a', 'b'))
+    chunk = mocker.spy(send_reminder_chunk, 'run')
+    res = send_reminders(menu_id=menu.id)
+    assert res == {menu.id: 3}
+    assert chunk.call_count == 3
+    assert menu.orders.filter(sent__isnull=True).count() == 0
+    assert list(OrderDate.objects.values_list('date', flat=True)) == [menu.date]
+    menu.refresh_from_db()
+    assert menu.sent is not None
+
+
+def test_send_reminders_rate_limited(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    menu, orders = setup_models(orders=3)
+    mocker.patch('menu.tasks.send_private_message', side_effect=[
+        ('a', 'b'), RateLimitExceeded('chat.postMessage', 30)])
+    order_ids = [str(o.pk) for o in orders]
+    # called directly, the retry raises the original exception
+    with pytest.raises(RateLimitExceeded):
+        send_reminder_chunk(menu.id, order_ids)
+    # the first order is saved so the retry won't send it again
+    assert menu.orders.filter(sent__isnull=False).count() == 1
+    menu.refresh_from_db()
+    assert menu.sent is None
+
+def test_send_reminders_progress(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    settings.SLACK_MAX_RETRIES = 0
+    menu, orders = setup_models(orders=3)
+    mocker.patch('menu.tasks.send_private_message', side_effect=[
+        ('a', '1'), RateLimitExceeded('chat.postMessage', 1),
+        ('a', '2'), RateLimitExceeded('chat.postMessage', 1), ('a', '3')])
+    send_reminders(menu_id=menu.id)
+    assert menu.orders.filter(sent__isnull=True).count() == 0
+    menu.refresh_from_db()
+    assert menu.sent is not None
+
+def test_send_reminders_connection_error(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    menu, orders = setup_models(orders=2)
+    send_private_message = mocker.patch(
+        'menu.tasks.send_private_message',
+        side_effect=[URLError('connection reset'), ('a', '1'), ('a', '2')])
+    send_reminders(menu_id=menu.id)
+    # the chunk is retried on its own and the menu is still finished
+    assert send_private_message.call_count == 3
+    assert menu.orders.filter(sent__isnull=True).count() == 0
+    menu.refresh_from_db()
+    assert menu.sent is not None
+
+def test_retry_later(mocker, settings):
+    settings.SLACK_RETRY_BACKOFF = 2
+    settings.SLACK_RETRY_BACKOFF_MAX = 60
+    task = mocker.Mock()
+
+    def countdown(retries, retry_after):
+        task.request.retries = retries
+        retry_later(task, RateLimitExceeded('chat.update', retry_after))
+        return task.retry.call_args[1]['countdown']
+
+    assert countdown(0, 1) == 2
+    assert countdown(3, 1) == 16
+    assert countdown(0, 30) == 30
+    assert countdown(10, 1) == 60
+
+
+def test_send_reminders_batches(mocker, settings):
+    settings.SLACK_CONCURRENCY = 1
+    settings.NORA_REMINDER_BATCH_SIZE = 2
+    menu, orders = setup_models(orders=5)
+    bulk_update = mocker.spy(Order.objects, 'bulk_update')
+    mocker.patch('menu.tasks.send_private_message', side_effect=[
+        ('a', '1'), ('a', '2'), ('a', '3'), RateLimitExceeded('chat.postMessage', 1)])
+    order_ids = [str(o.pk) for o in orders]
+    with pytest.raises(RateLimitExceeded):
+        send_reminder_chunk(menu.id, order_ids)
+    # the first chunk and the message sent in the second one are saved
+    assert bulk_update.call_count == 2
+    assert sorted(menu.orders.exclude(ts=None).values_list('ts', flat=True)) == ['1', '2', '3']
+
+    # the retry only sends the remaining orders
+    settings.SLACK_USE_REMINDERS = True
+    create_reminder = mocker.patch('menu.tasks.create_reminder')
+    res = send_reminder_chunk(menu.id, order_ids)
+    assert create_reminder.call_count == 2
+    assert res['count'] == 2
+    assert menu.orders.filter(sent__isnull=True).count() == 0
+
+def test_archive_orders(settings, tmp_path):
+    settings.NORA_ARCHIVE_DIR = str(tmp_path)
+    settings.NORA_ARCHIVE_DAYS = 30
+    settings.NORA_ARCHIVE_CHUNK_SIZE = 2
+    old, old_orders = setup_models(days=-40, orders=3)
+    for order in old_orders:
+        order.sent = now()
+        order.selected = 'a'
+        order.save()
+    Order.objects.filter(menu=old).update(
+        created=now() - timedelta(days=41), modified=now() - timedelta(days=40))
+    for order in old_orders:
+        order.refresh_from_db()
+    old.sent = now()
+    old.save()
+    recent, recent_order = setup_models(days=-10)
+    res = archive_orders()
+    assert res == {old.date.isoformat(): 3}
+    assert list(Order.objects.all()) == [recent_order]
+    assert list(Menu.objects.all()) == [recent]
+    assert not OrderDate.objects.filter(date=old.date).exists()
+    assert (tmp_path / f'{old.date:%Y-%m-%d}.jsonl.gz').exists()
+
+    assert restore_orders(old.date.isoformat()) == 3
+    assert not list(tmp_path.iterdir())
+    restored = Order.objects.filter(date=old.date).order_by('sent')
+    assert [(o.pk, o.menu_id, o.created, o.modified, o.sent, o.selected)
+            for o in restored] == [
+        (o.pk, old.id, o.created, o.modified, o.sent, 'a') for o in old_orders]
+    assert OrderDate.objects.filter(date=old.date).exists()
+
+
+def test_archive_orders_again(settings, tmp_path):
+    settings.NORA_ARCHIVE_DIR = str(tmp_path)
+    settings.NORA_ARCHIVE_DAYS = 30
+    first, first_orders = setup_models(days=-40, orders=2)
+    for order in first_orders:
+        order.sent = now()
+        order.save()
+    first.sent = now()
+    first.save()
+    date = first.date.isoformat()
+    assert archive_orders() == {date: 2}
+    path = tmp_path / f'{date}.jsonl.gz'
+    archived = path.read_bytes()
+    assert restore_orders(date) == 2
+    # a restore that stopped before removing the file skips the known rows
+    path.write_bytes(archived)
+    assert restore_orders(date) == 0
+    path.write_bytes(archived)
+
+    second, second_order = setup_models(days=-40)
+    second_order.sent = now()
+    second_order.save()
+    second.sent = now()
+    second.save()
+    # the earlier archive is kept, without the rows that came back
+    assert archive_orders() == {date: 3}
+    with gzip.open(path, 'rt') as lines:
+        assert len(lines.readlines()) == 5
+    assert restore_orders(date) == 3
+    assert Order.objects.filter(date=first.date).count() == 3
+    assert Menu.objects.count() == 2
+
+
+def test_archive_orders_disabled(settings):
+    settings.NORA_ARCHIVE_DAYS = 0
+    setup_models(days=-400)
+    assert archive_orders() == {}
+    assert Order.objects.count() == 1
@@ -1,9 +1,11 @@
+import json
 import pytest
 
 from django.urls import reverse
 from django.utils.timezone import localtime, now
 from datetime import timedelta
 
+from menu.live import get_broker
 from menu.models import Menu
 from .utils import setup_models
 
@@ -11,16 +13,6 @@ from .utils import setup_models
 pytestmark = pytest.mark.django_db
 
 
-@pytest.fixture
-def auth_client(mocker, client):
-    mocker.patch('slack.views.exchange_auth_code',
-                 return_value={'user_id': 'a',
-                               'team_id': 'a',
-                               'access_token': 'a'})
-    client.get(reverse('slack:auth')+'?code=dfg')
-    return client
-
-
 def test_protected_views(client, mocker):
     menu, order = setup_models()
 
@@ -69,6 +61,111 @@ class TestListOrder:
         assert future == (
             localtime(now()) + timedelta(days=days_in_the_future)).date()
 
+    def test_older_dates(self, auth_client, settings):
+        settings.NORA_DATE_PICKER_DAYS = 2
+        for days in (-1, -2, -3):
+            menu, order = setup_models(days=days)
+            order.sent = order.created
+            order.save()
+        res = auth_client.get(reverse('menu:order-list'))
+        today = localtime(now()).date()
+        assert res.context['dates'] == [
+            today - timedelta(days=2), today - timedelta(days=1), today]
+        assert res.context['older_days'] == 4
+        res = auth_client.get(reverse('menu:order-list')+'?days=4')
+        assert len(res.context['dates']) == 4
+        assert res.context['older_days'] is None
+
+    def test_not_modified(self, auth_client):
+        menu, order = setup_models(days=1)
+        order.sent = order.created
+        order.save()
+        url = reverse('menu:order-list')+f'?d={menu.date:%Y%m%d}'
+        res = auth_client.get(url)
+        etag = res['ETag']
+        res = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert res.status_code == 304
+        order.selected = 'a'
+        order.save()
+        res = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert res.status_code == 200
+        assert res['ETag'] != etag
+
+    def test_closed_day(self, auth_client, django_assert_num_queries):
+        menu, order = setup_models(days=-1)
+        order.sent = order.created
+        order.selected = 'a'
+        order.save()
+        url = reverse('menu:order-list')+f'?d={menu.date:%Y%m%d}'
+        # the day has an active order, so it's not cached
+        auth_client.get(url)
+        with django_assert_num_queries(5):
+            auth_client.get(url)
+        order.fulfilled = now()
+        order.save()
+        res = auth_client.get(url)
+        # only the session is read once the day is closed
+        with django_assert_num_queries(1):
+            cached = auth_client.get(url)
+        assert cached.content == res.content
+        assert cached['ETag'] == res['ETag']
+
+    def test_pages(self, auth_client, settings):
+        settings.NORA_PAGE_SIZE = 2
+        menu, orders = setup_models(days=1, orders=5)
+        for i, order in enumerate(orders):
+            order.sent = order.created
+            order.selected = 'a'
+            order.fulfilled = order.created if i == 4 else None
+            order.save()
+        url = reverse('menu:order-list')+f'?d={menu.date:%Y%m%d}'
+        listed = []
+        while url:
+            res = auth_client.get(url)
+            listed += res.context['active_orders']
+            assert res.context['ready_orders'] == orders[4:]
+            # the board doesn't add rows to a table split in pages
+            assert res.context['active_paginated']
+            assert not res.context['ready_paginated']
+            url = res.context['active_next']
+            if url:
+                url = reverse('menu:order-list') + url
+        assert listed == orders[:4]
+        assert res.context['first_page'] is not None
+
+    def test_state_filter(self, auth_client):
+        menu, orders = setup_models(days=1, orders=2)
+        for order in orders:
+            order.sent = order.created
+            order.selected = 'a'
+            order.save()
+        url = reverse('menu:order-list')+f'?d={menu.date:%Y%m%d}'
+        res = auth_client.get(url + '&state=ready')
+        assert res.context['active_orders'] == []
+        assert res.context['ready_orders'] == []
+        res = auth_client.get(url + '&state=active&active_cursor=broken')
+        assert res.context['active_orders'] == orders
+
+    def test_closed_today(self, auth_client, settings, mocker):
+        settings.NORA_THRESHOLD = 0
+        menu, order = setup_models(days=0)
+        order.sent = order.created
+        order.selected = 'a'
+        order.fulfilled = now()
+        order.save()
+        tomorrow, active = setup_models(days=1)
+        active.sent = active.created
+        active.selected = 'a'
+        active.save()
+        # today is closed, so its page is cached
+        res = auth_client.get(reverse('menu:order-list'))
+        assert res.context['ready_orders'] == [order]
+        # the same url shows the new day once the date changes
+        mocker.patch('menu.views.now',
+                     return_value=now() + timedelta(days=1))
+        res = auth_client.get(reverse('menu:order-list'))
+        assert res.context['active_orders'] == [active]
+
     def test_select_date(self, auth_client):
         date_in_the_future = (localtime(now()) + timedelta(days=5)).date()
         date_string = date_in_the_future.strftime('%Y%m%d')
@@ -113,6 +210,22 @@ class TestListOrder:
         states = check_state(auth_client)
         assert states == (0, 0, 1)
 
+    def test_queries(self, auth_client, django_assert_num_queries):
+        menu, orders = setup_models(days=1, orders=6)
+        date_string = menu.date.strftime('%Y%m%d')
+        for i, order in enumerate(orders):
+            order.sent = order.created
+            order.selected = 'a' if i % 3 else None
+            order.fulfilled = order.created if i % 3 == 2 else None
+            order.save()
+        url = reverse('menu:order-list')+f'?d={date_string}'
+        # session, order counts, dates and a page of each table
+        with django_assert_num_queries(5):
+            res = auth_client.get(url)
+        assert res.context['pending_orders'] == 2
+        assert len(res.context['active_orders']) == 2
+        assert len(res.context['ready_orders']) == 2
+
 
 class TestCreateMenu:
     def test_create(self, auth_client, mocker):
@@ -170,6 +283,27 @@ class TestListMenu:
         assert len(res.context.get('object_list')) == 10
 
 
+    def test_list_pages(self, auth_client, settings):
+        settings.NORA_PAGE_SIZE = 2
+        menus = [setup_models(days=d)[0] for d in range(1, 6)]
+        url = reverse('menu:menu-list')
+        listed = []
+        while url:
+            res = auth_client.get(url)
+            listed += res.context['object_list']
+            url = res.context['next_page']
+            if url:
+                url = reverse('menu:menu-list') + url
+        assert listed == menus[::-1]
+
+    def test_list_dates(self, auth_client):
+        menus = [setup_models(days=d)[0] for d in range(1, 6)]
+        since, until = menus[1].date, menus[3].date
+        res = auth_client.get(reverse('menu:menu-list') +
+                              f'?from={since:%Y-%m-%d}&to={until:%Y%m%d}')
+        assert list(res.context['object_list']) == menus[3:0:-1]
+
+
 class TestDeleteMenu:
     def test_delete_confirm(self, auth_client):
         menu, _ = setup_models(days=1)
@@ -208,6 +342,7 @@ class TestUpdateOrder:
         assert order.selected is None
 
         update = mocker.patch('menu.views.update_order.delay')
+        publish = mocker.patch('menu.views.publish_order')
 
         res = client.post(
             reverse('menu:order-update', kwargs={'pk': order.pk}),
@@ -217,6 +352,7 @@ class TestUpdateOrder:
 
         order.refresh_from_db()
         assert order.selected == order.menu.options[0]
+        publish.assert_called_once_with(order, 'pending')
 
 
 def test_order_complete(auth_client, mocker):
@@ -252,3 +388,32 @@ def test_order_complete(auth_client, mocker):
     order.refresh_from_db()
     update.assert_not_called()
     assert order.fulfilled is not None
+
+
+def test_order_stream(auth_client, mocker):
+    menu, order = setup_models(days=1)
+    order.sent = now()
+    order.selected = order.menu.options[0]
+    order.save()
+    mocker.patch('menu.views.update_order.delay')
+    res = auth_client.get(
+        reverse('menu:order-stream')+f'?d={menu.date:%Y%m%d}')
+    assert res['Content-Type'] == 'text/event-stream'
+    events = iter(res.streaming_content)
+    assert next(events) == b'retry: 3000\n\n'
+
+    # the events of other dates are not received
+    _, other = setup_models(days=2)
+    other.selected = 'a'
+    other.save()
+    auth_client.get(reverse('menu:order-complete', kwargs={'pk': other.pk}))
+    auth_client.get(reverse('menu:order-complete', kwargs={'pk': order.pk}))
+    event, data = next(events).decode().split('\n')[:2]
+    assert event == 'event: order'
+    data = json.loads(data[len('data: '):])
+    assert data['id'] == str(order.pk)
+    assert data['state'] == 'ready'
+    assert data['previous'] == 'active'
+    assert f'id="order-{order.pk}"' in data['row']
+    res.close()
+    assert not any(get_broker().subscribers.values())
@@ -0,0 +1,25 @@
+import pytest
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def test_pragmas(settings):
+    options = settings.DATABASES['default']['OPTIONS']
+    assert options['pragmas']['synchronous'] == 'NORMAL'
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        # NORMAL
+        assert cursor.fetchone() == (1,)
+        cursor.execute('PRAGMA cache_size')
+        assert cursor.fetchone() == (-64 * 1024,)
+
+
+def test_immediate_transactions():
+    with CaptureQueriesContext(connection) as queries:
+        with transaction.atomic():
+            pass
+    assert queries[0]['sql'] == 'BEGIN IMMEDIATE'
@@ -1,8 +1,10 @@
 import pytest
 
 from django.core.validators import URLValidator
-from slack.api import (get_add_link, exchange_auth_code, WebClient, get_users,
-    send_private_message, delete_message, create_reminder)
+from slack.api import (get_add_link, exchange_auth_code, WebClient,
+    get_member_pages, send_private_message, delete_message, create_reminder)
+from slack.ratelimit import RateLimitExceeded
+from slack_sdk.errors import SlackApiError
 
 pytestmark = pytest.mark.django_db
 
@@ -19,31 +21,25 @@ def test_exchange_auth_code(mocker, settings):
         client_secret=settings.SLACK_CLIENT_SECRET,
         code='a')
 
-def test_get_users(mocker, settings):
-    test_clients = [
-        {'name': 'test1', 'is_bot': False, 'tz': settings.TIME_ZONE, 
-        'id': 1, 'real_name': 'Test 1'},
-        {'name': 'test2', 'is_bot': True, 'tz': settings.TIME_ZONE,
-        'id': 2, 'real_name': 'Test 2'},
-        {'name': 'test3', 'is_bot': False, 'tz': 'Oceania',
-        'id': 3, 'real_name': 'Test 3'}
+def test_get_member_pages(mocker, settings):
+    member = lambda i, **kw: dict({'name': f'test{i}', 'is_bot': False,
+        'tz': settings.TIME_ZONE, 'id': i, 'real_name': f'Test {i}'}, **kw)
+    pages = [
+        {'members': [member(1), member(2, is_bot=True)],
+         'response_metadata': {'next_cursor': 'abc'}},
+        {'members': [member(3, deleted=True, tz='Oceania')],
+         'response_metadata': {'next_cursor': ''}},
     ]
-    mocker.patch('slack.api.get_access_token')
-    method = mocker.patch.object(WebClient, 'users_list', 
-        return_value={'members': test_clients})
-    # only locals
-    settings.NORA_ONLY_LOCALS = True
-    res = list(get_users())
-    assert (1, 'Test 1') in res
-    assert (2, 'Test 2') not in res
-    assert (3, 'Test 3') not in res
-
-    # not only locals
-    settings.NORA_ONLY_LOCALS = False
-    res = list(get_users())
-    assert (1, 'Test 1') in res
-    assert (2, 'Test 2') not in res
-    assert (3, 'Test 3') in res
+    mocker.patch('slack.client.get_access_token')
+    method = mocker.patch.object(WebClient, 'users_list', side_effect=pages)
+    res = list(get_member_pages(limit=2))
+    # bots are skipped, deleted and foreign users are left to the caller
+    assert res == [
+        [{'id': 1, 'real_name': 'Test 1', 'tz': settings.TIME_ZONE,
+          'deleted': False}],
+        [{'id': 3, 'real_name': 'Test 3', 'tz': 'Oceania', 'deleted': True}]]
+    assert method.call_count == 2
+    method.assert_called_with(limit=2, cursor='abc')
 
 def test_send_private_message(mocker):
     method = mocker.patch.object(WebClient, 'api_call', 
@@ -52,6 +48,17 @@ def test_send_private_message(mocker):
     method.assert_called()
     assert res == ('a', 'b')
 
+def test_send_private_message_rate_limited(mocker):
+    response = mocker.Mock(headers={'Retry-After': '30'})
+    response.__getitem__ = lambda self, key: 'ratelimited'
+    mocker.patch('slack.client.get_access_token')
+    mocker.patch.object(WebClient, 'api_call',
+        side_effect=SlackApiError('ratelimited', response))
+    with pytest.raises(RateLimitExceeded) as exc:
+        send_private_message('a', 'c', 'b')
+    assert exc.value.retry_after == 30
+    assert exc.value.method == 'chat.update'
+
 def test_delete_message(mocker):
     method = mocker.patch.object(WebClient, 'chat_delete')
     delete_message('a', 'b')
@@ -1 +1,55 @@
-"""I couldn't think of anything to test in this module, really"""
+import pytest
+
+from slack.auth import (get_access_token, check_user_identity,
+    identity_cache_stats, SESSION_KEY)
+from slack.models import SlackIdentity
+
+
+@pytest.mark.django_db
+def test_access_token_cache(django_assert_num_queries):
+    SlackIdentity.objects.create(user_id='a', team_id='b', access_token='1')
+    assert get_access_token() == '1'
+    with django_assert_num_queries(0):
+        assert get_access_token() == '1'
+
+    # saving the identity invalidates the cache
+    SlackIdentity.objects.create(user_id='a', team_id='b', access_token='2')
+    assert get_access_token() == '2'
+
+    # so does deleting it
+    SlackIdentity.load().delete()
+    assert get_access_token() == ''
+
+
+@pytest.mark.django_db
+def test_access_token_ttl(settings):
+    settings.SLACK_TOKEN_CACHE_TTL = 0
+    SlackIdentity.objects.create(user_id='a', team_id='b', access_token='1')
+    get_access_token()
+    # changes made by other processes are picked up after the ttl
+    SlackIdentity.objects.filter(pk=1).update(access_token='2')
+    assert get_access_token() == '2'
+
+
+@pytest.mark.django_db
+def test_check_user_identity_cache(mocker, django_assert_num_queries):
+    request = mocker.Mock(session={})
+    # no identity installed yet
+    assert not check_user_identity(request)
+
+    identity = SlackIdentity.objects.create(
+        user_id='a', team_id='b', access_token='1')
+    request.session[SESSION_KEY] = identity.identity_hash
+    assert check_user_identity(request)
+
+    hits = identity_cache_stats['hits']
+    with django_assert_num_queries(0):
+        assert check_user_identity(request)
+    assert identity_cache_stats['hits'] == hits + 1
+
+    # a new identity invalidates the old sessions
+    SlackIdentity.objects.create(user_id='a', team_id='b', access_token='2')
+    assert not check_user_identity(request)
+
+    SlackIdentity.load().delete()
+    assert not check_user_identity(request)
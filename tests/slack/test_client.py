@@ -0,0 +1,60 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from slack.client import PooledWebClient, get_client
+
+
+class SlackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        SlackHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'ok': True, 'channel': 'a', 'ts': 'b'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slack_server():
+    SlackHandler.connections = 0
+    server = HTTPServer(('127.0.0.1', 0), SlackHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/api/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_keep_alive(slack_server):
+    client = PooledWebClient(token='xoxp-test', base_url=slack_server)
+    for _ in range(3):
+        response = client.api_call('chat.postMessage',
+                                   json={'channel': 'a', 'text': 'b'})
+        assert response.get('ts') == 'b'
+    client.users_list(limit=10)
+    assert SlackHandler.connections == 1
+
+
+def test_get_client(mocker):
+    token = mocker.patch('slack.client.get_access_token', return_value='a')
+    client = get_client()
+    assert get_client() is client
+    # a new token builds a new client
+    token.return_value = 'b'
+    assert get_client() is not client
+    assert get_client().token == 'b'
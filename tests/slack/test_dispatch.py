@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from slack.dispatch import dispatch, get_executor, Throughput
+
+
+def test_dispatch_results():
+    throughput = Throughput()
+    res = dict(dispatch(lambda x: x * 2, range(20), concurrency=4,
+                        throughput=throughput))
+    assert res == {x: x * 2 for x in range(20)}
+    assert throughput.count == 20
+    assert throughput.as_dict()['count'] == 20
+
+
+def test_dispatch_concurrency():
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def job(x):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(0.01)
+        with lock:
+            state['running'] -= 1
+        return x
+
+    list(dispatch(job, range(30), concurrency=3))
+    assert 1 < state['peak'] <= 3
+
+
+def test_dispatch_error():
+    started = []
+
+    def job(x):
+        started.append(x)
+        if x == 0:
+            raise ValueError('boom')
+        return x
+
+    with pytest.raises(ValueError):
+        list(dispatch(job, range(100), concurrency=2))
+    # the remaining jobs are not started
+    assert len(started) < 100
+
+
+def test_dispatch_keeps_threads():
+    threads = set()
+
+    def job(x):
+        threads.add(threading.current_thread())
+        return x
+
+    list(dispatch(job, range(10), concurrency=2))
+    # the threads outlive the call, with the connections they keep alive
+    assert threads and all(t.is_alive() for t in threads)
+    assert get_executor(2) is get_executor(1)
@@ -0,0 +1,46 @@
+import pytest
+
+from slack.ratelimit import (LocalBackend, RateLimiter, RateLimitExceeded,
+    get_rate_limiter)
+
+
+def test_local_backend_burst():
+    backend = LocalBackend()
+    for _ in range(3):
+        granted, wait = backend.take('a', rate=1, burst=3, max_wait=-1)
+        assert granted and wait == 0
+    # the bucket is empty, the next token is due in about a second
+    granted, wait = backend.take('a', rate=1, burst=3, max_wait=-1)
+    assert granted and 0.9 < wait <= 1
+    # other keys have their own bucket
+    granted, wait = backend.take('b', rate=1, burst=3, max_wait=-1)
+    assert granted and wait == 0
+
+
+def test_local_backend_max_wait():
+    backend = LocalBackend()
+    backend.take('a', rate=1, burst=1, max_wait=-1)
+    granted, wait = backend.take('a', rate=1, burst=1, max_wait=0.5)
+    assert not granted and wait > 0.5
+    # a refused call doesn't consume the budget
+    granted, second_wait = backend.take('a', rate=1, burst=1, max_wait=0.5)
+    assert not granted and second_wait <= wait
+
+
+def test_rate_limiter(settings, mocker):
+    settings.SLACK_RATE_LIMITS = {'chat.update': (60, 1)}
+    sleep = mocker.patch('slack.ratelimit.time.sleep')
+    limiter = RateLimiter(LocalBackend())
+    assert limiter.acquire('chat.update') == 0
+    assert limiter.acquire('chat.update') > 0
+    sleep.assert_called_once()
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.acquire('chat.update', max_wait=0)
+    assert exc.value.retry_after > 0
+    # methods without a tier are not limited
+    assert limiter.acquire('auth.test') == 0
+
+
+def test_get_rate_limiter():
+    assert get_rate_limiter() is get_rate_limiter()
+    assert isinstance(get_rate_limiter().backend, LocalBackend)